@@ -0,0 +1,114 @@
+import numpy as np
+
+import os
+
+from itertools import product
+
+from bit_ballots import *
+
+# Catalogue of all the transitive incomplete ballots over numAlts alternatives. The catalogue of m alternatives is
+# the sorted array of the beats words (see bit_ballots) of all the ballots, stored in a .npy file that is built
+# once and then memory-mapped by every process. The position of a ballot in the array is its catalogue index.
+# Catalogues are built up to 7 alternatives (6,129,859 ballots), the 431,723,379 ballots over 8 alternatives
+# would not fit in memory
+
+# Default directory of the catalogue files, can be changed with the BALLOT_CATALOGUE_DIR environment variable
+def catalogue_directory():
+	return os.environ.get("BALLOT_CATALOGUE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ballotCatalogue"))
+
+# Path of the catalogue file for numAlts alternatives
+def catalogue_path(numAlts, directory = None):
+	return os.path.join(directory or catalogue_directory(), "ballots_{}.npy".format(numAlts))
+
+# Returns the sorted beats words of all the transitive ballots over numAlts alternatives, computed from the ones
+# over numAlts - 1 alternatives: the new alternative e is put above a set D and below a set U of the previous
+# alternatives, which gives a transitive ballot if and only if D is closed downwards, U is closed upwards, and
+# every alternative of U is above every alternative of D
+def build_catalogue(numAlts, previous = None):
+	if numAlts <= 1:
+		return np.zeros(1, dtype = np.uint64)
+	if previous is None:
+		previous = build_catalogue(numAlts - 1)
+	previous = np.asarray(previous, dtype = np.uint64)
+	new = numAlts - 1
+	shifts = np.uint64(MAX_PACKED_ALTS) * np.arange(new, dtype = np.uint64)
+	# below[:, i] is the set of the alternatives below i, above[:, i] the set of the alternatives above i
+	below = ((previous[:, None] >> shifts) & np.uint64(0xFF)).astype(np.uint16)
+	above = np.zeros_like(below)
+	for i in range(new):
+		for k in range(new):
+			above[:, i] |= ((below[:, k] >> i) & 1) << k
+	ballots = []
+	for assignment in product([0, 1, 2], repeat = new):
+		downSet = sum(1 << i for i in range(new) if assignment[i] == 1)
+		upSet = sum(1 << i for i in range(new) if assignment[i] == 2)
+		valid = np.ones(len(previous), dtype = bool)
+		for i in range(new):
+			if assignment[i] == 1:
+				valid &= (below[:, i] & (0xFF & ~downSet)) == 0
+			elif assignment[i] == 2:
+				valid &= ((above[:, i] & (0xFF & ~upSet)) == 0) & ((below[:, i] & downSet) == downSet)
+		word = sum(relation_bit(i, new) for i in range(new) if assignment[i] == 2) + (downSet << (MAX_PACKED_ALTS * new))
+		ballots.append(previous[valid] | np.uint64(word))
+	return np.sort(np.concatenate(ballots))
+
+# Catalogues already loaded by this process
+_catalogues = {}
+
+# Returns the catalogue of numAlts alternatives as a read-only memory-mapped array, building and saving it first
+# if its file does not exist yet. The file is written under a temporary name and then renamed, so concurrent
+# processes building the same catalogue never read a partial file
+def load_catalogue(numAlts, directory = None):
+	path = catalogue_path(numAlts, directory)
+	if path not in _catalogues:
+		if not os.path.exists(path):
+			if numAlts > 7:
+				raise ValueError("Ballot catalogues are limited to 7 alternatives")
+			previous = load_catalogue(numAlts - 1, directory) if numAlts > 1 else None
+			os.makedirs(os.path.dirname(path), exist_ok = True)
+			temporaryPath = "{}.{}.tmp.npy".format(path[:-len(".npy")], os.getpid())
+			np.save(temporaryPath, build_catalogue(numAlts, previous))
+			os.replace(temporaryPath, path)
+		_catalogues[path] = np.load(path, mmap_mode = "r")
+	return _catalogues[path]
+
+# Returns the number of transitive ballots over numAlts alternatives
+def catalogue_size(numAlts, directory = None):
+	return len(load_catalogue(numAlts, directory))
+
+# Returns the ballots with the given catalogue indices as an int8 array of shape indices.shape + (m, m)
+def catalogue_ballots(numAlts, indices, directory = None):
+	beats = np.asarray(load_catalogue(numAlts, directory)[np.asarray(indices)])
+	relations = (beats[..., None, None] & bit_weights(numAlts)) != 0
+	return relations.astype(np.int8) - np.swapaxes(relations, -1, -2).astype(np.int8)
+
+# Returns the ballots with the given catalogue indices as a PackedProfile
+def catalogue_packed_profile(numAlts, indices, directory = None):
+	return pack_profile(catalogue_ballots(numAlts, indices, directory))
+
+# Returns the catalogue indices of the ballots of the array ballots of shape (..., m, m), or of a PackedBallot
+def catalogue_index(ballots, directory = None):
+	if isinstance(ballots, PackedBallot):
+		(numAlts, beats) = (ballots.numAlts, np.uint64(ballots.beats))
+	else:
+		ballots = np.asarray(ballots)
+		numAlts = ballots.shape[-1]
+		beats = np.where(ballots == 1, bit_weights(numAlts), np.uint64(0)).sum(axis = (-2, -1), dtype = np.uint64)
+	catalogue = load_catalogue(numAlts, directory)
+	indices = np.searchsorted(catalogue, beats)
+	if np.any(indices >= len(catalogue)) or np.any(catalogue[np.minimum(indices, len(catalogue) - 1)] != beats):
+		raise ValueError("Some ballots are not transitive")
+	return indices
+
+# Draws size catalogue indices uniformly at random, using the generator rng or the global numpy state
+def sample_catalogue_indices(numAlts, size, rng = None, directory = None):
+	numBallots = catalogue_size(numAlts, directory)
+	if rng is None:
+		return np.random.randint(0, numBallots, size)
+	return rng.integers(0, numBallots, size)
+
+# Returns the number of decided pairs of alternatives of each ballot of the catalogue of numAlts alternatives, a
+# decided pair setting exactly one bit of the beats word
+def catalogue_decided_pairs(numAlts, directory = None):
+	beats = np.ascontiguousarray(load_catalogue(numAlts, directory))
+	return np.unpackbits(beats.view(np.uint8)).reshape(len(beats), -1).sum(axis = 1)
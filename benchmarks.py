@@ -0,0 +1,191 @@
+from data_generation import *
+from maj_dynamics import *
+from experiments import *
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+
+import kernels
+
+# Benchmarks of the hot paths of the dynamics, the criteria and the profile generation over a grid of numbers of
+# voters n and alternatives m. Every case draws its inputs from a generator with a fixed seed, so two runs time the
+# same work. Usage:
+#   python benchmarks.py run [--n 1 10 100 1000] [--m 3 4 5 6 7 8] [--only update condorcet ...] [--output file.json]
+#   python benchmarks.py compare baseline.json current.json [--threshold 0.2]
+# compare exits with status 1 if a case is slower than in the baseline by more than the threshold
+
+DEFAULT_NUM_AGENTS = [1, 10, 100, 1000]
+DEFAULT_NUM_ALTS = [3, 4, 5, 6, 7, 8]
+SEED = 20230601
+
+# Returns a transitive profile of n ballots over m alternatives as an int8 array of shape (n, m, m). The ballots are
+# drawn uniformly from the catalogue up to 7 alternatives. Above, there is no catalogue and rejection sampling is
+# hopeless, so each ballot is the dominance order of m random points of the plane (a > b if a is above and to the
+# right of b), which is always transitive
+def benchmarkProfile(n, m, rng):
+	if m <= 7:
+		return profile_generation_batch(1, n, m, rng)[0]
+	points = rng.random((n, m, 2))
+	beats = np.all(points[:, :, None, :] > points[:, None, :, :], axis = -1)
+	return beats.astype(np.int8) - np.swapaxes(beats, -1, -2).astype(np.int8)
+
+# Calls function until it has run for at least minTime seconds and at least minRepeats times, a single call longer
+# than maxTime seconds being enough. Returns the durations of the calls
+def timeCalls(function, minTime = 0.2, minRepeats = 3, maxTime = 5):
+	durations = []
+	while (sum(durations) < minTime or len(durations) < minRepeats) and not (len(durations) > 0 and durations[0] > maxTime):
+		startingTime = time.perf_counter()
+		function()
+		durations.append(time.perf_counter() - startingTime)
+	return durations
+
+# Returns the update order of the pairs of alternatives in increasing order
+def increasingOrder(m):
+	return [(i, j) for i in range(m) for j in range(i + 1, m)]
+
+# Functions building the benchmarked calls: each one takes (n, m, rng), draws the inputs and returns the function
+# to time
+def benchUpdate(n, m, rng):
+	profile = benchmarkProfile(n, m, rng)
+	return lambda: update(profile, increasingOrder(m))
+
+def benchUpdateBatch(n, m, rng):
+	profiles = np.array([benchmarkProfile(n, m, rng) for _ in range(10)])
+	return lambda: update_batch(profiles, increasingOrder(m))
+
+def benchCheckTransitivity(n, m, rng):
+	profile = benchmarkProfile(n, m, rng)
+	return lambda: [check_transitivity(ballot) for ballot in profile]
+
+def benchAllCriteria(n, m, rng):
+	profile = benchmarkProfile(n, m, rng)
+	return lambda: all_criteria(profile)
+
+def benchCriteria(criteria):
+	def bench(n, m, rng):
+		profile = benchmarkProfile(n, m, rng)
+		return lambda: criteria(profile)
+	return bench
+
+def benchProfileGeneration(n, m, rng):
+	return lambda: profile_generation(n, m, rng = rng)
+
+def benchProfileGenerationBatch(n, m, rng):
+	return lambda: profile_generation_batch(100, n, m, rng)
+
+def benchGetAllBallots(n, m, rng):
+	return lambda: sum(1 for _ in getAllBallots(m))
+
+def benchFrequencyExperiment(n, m, rng):
+	return lambda: frequencyExperiment(n, m, 100, randomProfiles, rng = rng)
+
+def benchManipulationExperiment(n, m, rng):
+	return lambda: manipulationExperiment(n, m, rng = rng)
+
+# The benchmarks, mapping their names to the function building the call to time and to a predicate on (n, m)
+# telling whether the case is run. The limits exclude the cases that would take minutes or cannot run: there is no
+# catalogue above 7 alternatives, rejection sampling is too slow above 6 alternatives and manipulationExperiment
+# explores all the update orders. getAllBallots does not depend on n, it is only run for the smallest n of the grid
+def benchmarkCases():
+	cases = {
+		"update": (benchUpdate, lambda n, m: True),
+		"update_batch": (benchUpdateBatch, lambda n, m: True),
+		"check_transitivity": (benchCheckTransitivity, lambda n, m: True),
+		"all_criteria": (benchAllCriteria, lambda n, m: True),
+		"profile_generation": (benchProfileGeneration, lambda n, m: m <= 6 or (m == 7 and n <= 10)),
+		"profile_generation_batch": (benchProfileGenerationBatch, lambda n, m: m <= 7),
+		"getAllBallots": (benchGetAllBallots, lambda n, m: m <= 7),
+		"frequencyExperiment": (benchFrequencyExperiment, lambda n, m: m <= 7),
+		"manipulationExperiment": (benchManipulationExperiment, lambda n, m: m <= 4 and n <= 100),
+	}
+	for criteria in criteriaList():
+		cases[criteria.__name__] = (benchCriteria(criteria), lambda n, m: True)
+	return cases
+
+# Returns the description of the environment of the run
+def benchmarkEnvironment():
+	try:
+		commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+			cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except OSError:
+		commit = None
+	return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+		"kernelBackend": kernels.KERNEL_BACKEND, "commit": commit, "seed": SEED, "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+# Runs the benchmarks of names (all of them if None) over the grid of numAgentsList and numAltsList and returns the
+# results as a dictionnary. A case is identified by "name/n/m" and has the median and minimum durations of its calls
+def runBenchmarks(numAgentsList = DEFAULT_NUM_AGENTS, numAltsList = DEFAULT_NUM_ALTS, names = None, minTime = 0.2):
+	cases = benchmarkCases()
+	results = {}
+	for name, (setup, runnable) in cases.items():
+		if names is not None and name not in names:
+			continue
+		for m in numAltsList:
+			for n in numAgentsList:
+				if not runnable(n, m) or (name == "getAllBallots" and n != min(numAgentsList)):
+					continue
+				rng = np.random.default_rng(np.random.SeedSequence(SEED, spawn_key = (n, m)))
+				function = setup(n, m, rng)
+				# The experiments print their progress
+				with contextlib.redirect_stdout(io.StringIO()):
+					durations = timeCalls(function, minTime)
+				results["{}/{}/{}".format(name, n, m)] = {"benchmark": name, "n": n, "m": m, "median": statistics.median(durations),
+					"min": min(durations), "repeats": len(durations)}
+				print("{:<28} n = {:<5} m = {}  {:.6f} s".format(name, n, m, statistics.median(durations)))
+				sys.stdout.flush()
+	return {"environment": benchmarkEnvironment(), "results": results}
+
+# Compares the results of the benchmark files baselinePath and currentPath. Returns the list of the cases whose
+# minimum duration, the least sensitive to the noise of the machine, grew by more than threshold (as a fraction of
+# the baseline), printing a line per common case
+def compareBenchmarks(baselinePath, currentPath, threshold = 0.2):
+	with open(baselinePath) as file:
+		baseline = json.load(file)["results"]
+	with open(currentPath) as file:
+		current = json.load(file)["results"]
+	regressions = []
+	for case in sorted(set(baseline) & set(current), key = lambda case: (current[case]["benchmark"], current[case]["m"], current[case]["n"])):
+		ratio = current[case]["min"] / max(baseline[case]["min"], 1e-12)
+		flag = ""
+		if ratio > 1 + threshold:
+			flag = "REGRESSION"
+			regressions.append(case)
+		elif ratio < 1 / (1 + threshold):
+			flag = "faster"
+		print("{:<40} {:.6f} s -> {:.6f} s  x{:.2f}  {}".format(case, baseline[case]["min"], current[case]["min"], ratio, flag))
+	for case in sorted(set(baseline) ^ set(current)):
+		print("{:<40} only in {}".format(case, "the baseline" if case in baseline else "the current results"))
+	print("{} regression(s) over {} common cases.".format(len(regressions), len(set(baseline) & set(current))))
+	return regressions
+
+def main(arguments = None):
+	parser = argparse.ArgumentParser(description = "Benchmarks of the majority dynamics")
+	subparsers = parser.add_subparsers(dest = "command", required = True)
+	runParser = subparsers.add_parser("run", help = "run the benchmarks and write their results")
+	runParser.add_argument("--n", type = int, nargs = "+", default = DEFAULT_NUM_AGENTS, help = "numbers of voters")
+	runParser.add_argument("--m", type = int, nargs = "+", default = DEFAULT_NUM_ALTS, help = "numbers of alternatives")
+	runParser.add_argument("--only", nargs = "+", default = None, help = "names of the benchmarks to run")
+	runParser.add_argument("--min-time", type = float, default = 0.2, help = "minimal time spent on each case, in seconds")
+	runParser.add_argument("--output", default = "benchmarkResults.json", help = "file to write the results to")
+	compareParser = subparsers.add_parser("compare", help = "compare results against a baseline")
+	compareParser.add_argument("baseline")
+	compareParser.add_argument("current")
+	compareParser.add_argument("--threshold", type = float, default = 0.2, help = "relative slowdown flagged as a regression")
+	arguments = parser.parse_args(arguments)
+
+	if arguments.command == "run":
+		results = runBenchmarks(arguments.n, arguments.m, arguments.only, arguments.min_time)
+		with open(arguments.output, "w") as file:
+			json.dump(results, file, indent = 1)
+		print("Results written to {}.".format(arguments.output))
+		return 0
+	return 1 if len(compareBenchmarks(arguments.baseline, arguments.current, arguments.threshold)) > 0 else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,165 @@
+import numpy as np
+
+# Largest number of alternatives for which a ballot fits in a 64 bits word
+MAX_PACKED_ALTS = 8
+
+# Bit of the relation between the alternatives i and j in a packed ballot, the relation i > j being stored at
+# position 8 * i + j so that row i of the ballot is the byte i of the word
+def relation_bit(i, j):
+	return 1 << (MAX_PACKED_ALTS * i + j)
+
+# Returns the byte i of the word mask, i.e., the set of alternatives j such that the bit (i, j) is set
+def packed_row(mask, i):
+	return (mask >> (MAX_PACKED_ALTS * i)) & 0xFF
+
+# Matrix of the bit weights, used to pack and unpack ballots with numpy
+def bit_weights(numAlts):
+	return np.array([[relation_bit(i, j) for j in range(numAlts)] for i in range(numAlts)], dtype = np.uint64)
+
+# A ballot over at most 8 alternatives stored as two words: beats has the bit (i, j) set when i > j and beaten
+# has the bit (i, j) set when j > i, beaten is thus the transpose of beats. Indexing a packed ballot as
+# ballot[i][j] gives back the -1/0/1 value of the matrix representation
+class PackedBallot:
+	__slots__ = ("beats", "beaten", "numAlts")
+
+	def __init__(self, beats, beaten, numAlts):
+		self.beats = int(beats)
+		self.beaten = int(beaten)
+		self.numAlts = numAlts
+
+	def __len__(self):
+		return self.numAlts
+
+	def __getitem__(self, i):
+		beats = packed_row(self.beats, i)
+		beaten = packed_row(self.beaten, i)
+		return [((beats >> j) & 1) - ((beaten >> j) & 1) for j in range(self.numAlts)]
+
+	def __eq__(self, other):
+		return isinstance(other, PackedBallot) and (self.beats, self.beaten, self.numAlts) == (other.beats, other.beaten, other.numAlts)
+
+	def __hash__(self):
+		return hash((self.beats, self.beaten, self.numAlts))
+
+	def __repr__(self):
+		return "PackedBallot({:#x}, {:#x}, {})".format(self.beats, self.beaten, self.numAlts)
+
+# A profile of packed ballots stored as two uint64 arrays, one entry per voter. Indexing it gives the
+# PackedBallot of a voter
+class PackedProfile:
+	__slots__ = ("beats", "beaten", "numAlts")
+
+	def __init__(self, beats, beaten, numAlts):
+		self.beats = np.asarray(beats, dtype = np.uint64)
+		self.beaten = np.asarray(beaten, dtype = np.uint64)
+		self.numAlts = numAlts
+
+	def __len__(self):
+		return len(self.beats)
+
+	def __getitem__(self, voter):
+		return PackedBallot(self.beats[voter], self.beaten[voter], self.numAlts)
+
+	def __iter__(self):
+		for voter in range(len(self)):
+			yield self[voter]
+
+	def __repr__(self):
+		return "PackedProfile({} voters, {} alternatives)".format(len(self), self.numAlts)
+
+# Packs a ballot given in the matrix representation
+def pack_ballot(pref):
+	pref = np.asarray(pref)
+	numAlts = len(pref)
+	if numAlts > MAX_PACKED_ALTS:
+		raise ValueError("Packed ballots are limited to {} alternatives".format(MAX_PACKED_ALTS))
+	weights = bit_weights(numAlts)
+	return PackedBallot(np.sum(weights[pref == 1]), np.sum(weights[pref == -1]), numAlts)
+
+# Returns the matrix representation of the packed ballot
+def unpack_ballot(ballot):
+	weights = bit_weights(ballot.numAlts)
+	beats = (np.uint64(ballot.beats) & weights) != 0
+	beaten = (np.uint64(ballot.beaten) & weights) != 0
+	return beats.astype(np.int8) - beaten.astype(np.int8)
+
+# Packs a profile given as a list (or array) of ballots in the matrix representation
+def pack_profile(profile):
+	profile = np.asarray(profile)
+	numAlts = profile.shape[-1]
+	if numAlts > MAX_PACKED_ALTS:
+		raise ValueError("Packed ballots are limited to {} alternatives".format(MAX_PACKED_ALTS))
+	weights = bit_weights(numAlts)
+	beats = np.where(profile == 1, weights, np.uint64(0)).sum(axis = (-2, -1), dtype = np.uint64)
+	beaten = np.where(profile == -1, weights, np.uint64(0)).sum(axis = (-2, -1), dtype = np.uint64)
+	return PackedProfile(beats, beaten, numAlts)
+
+# Returns the matrix representation of the packed profile as an array of shape (voters, m, m)
+def unpack_profile(profile):
+	weights = bit_weights(profile.numAlts)
+	beats = (profile.beats[:, None, None] & weights) != 0
+	beaten = (profile.beaten[:, None, None] & weights) != 0
+	return beats.astype(np.int8) - beaten.astype(np.int8)
+
+# Returns the majority matrix of the packed profile
+def packed_majority_matrix(profile):
+	return unpack_profile(profile).sum(axis = 0, dtype = np.int64)
+
+# Returns True if the packed ballot is transitive: for every k > q, all the alternatives below q are below k
+def packed_is_transitive(ballot):
+	for k in range(ballot.numAlts):
+		below_k = packed_row(ballot.beats, k)
+		for q in range(ballot.numAlts):
+			if (below_k >> q) & 1 and packed_row(ballot.beats, q) & ~below_k:
+				return False
+	return True
+
+# Returns True if the alternative is above all the other ones in the packed ballot
+def packed_is_dominant(ballot, alternative):
+	return packed_row(ballot.beats, alternative) == ((1 << ballot.numAlts) - 1) & ~(1 << alternative)
+
+# Returns True if the alternative is below none of the other ones in the packed ballot
+def packed_is_undominated(ballot, alternative):
+	return packed_row(ballot.beaten, alternative) == 0
+
+# Adds the relation x > y to the ballot given by the words beats and beaten and closes it under transitivity:
+# all the alternatives weakly above x are put above all the alternatives weakly below y. Returns the new pair
+# of words (beats, beaten)
+def packed_add_relation(beats, beaten, x, y):
+	above = packed_row(beaten, x) | (1 << x)
+	below = packed_row(beats, y) | (1 << y)
+	for k in range(MAX_PACKED_ALTS):
+		if (above >> k) & 1:
+			beats |= below << (MAX_PACKED_ALTS * k)
+		if (below >> k) & 1:
+			beaten |= above << (MAX_PACKED_ALTS * k)
+	return (beats, beaten)
+
+# Interned ballots: each distinct packed ballot gets an integer ID the first time it is seen. The IDs are
+# specific to the process that interned the ballots
+_internedIds = {}
+_internedBallots = []
+
+# Returns the ID of the ballot (packed or in the matrix representation), interning it if needed
+def intern_ballot(ballot):
+	if not isinstance(ballot, PackedBallot):
+		ballot = pack_ballot(ballot)
+	ballotId = _internedIds.get(ballot)
+	if ballotId is None:
+		ballotId = len(_internedBallots)
+		_internedIds[ballot] = ballotId
+		_internedBallots.append(ballot)
+	return ballotId
+
+# Returns the packed ballot with the given ID
+def interned_ballot(ballotId):
+	return _internedBallots[ballotId]
+
+# Returns the array of the IDs of the ballots of the profile
+def intern_profile(profile):
+	return np.array([intern_ballot(ballot) for ballot in profile], dtype = np.int64)
+
+# Returns the packed profile whose ballots have the given IDs
+def profile_from_ids(ballotIds):
+	ballots = [interned_ballot(ballotId) for ballotId in ballotIds]
+	return PackedProfile([b.beats for b in ballots], [b.beaten for b in ballots], ballots[0].numAlts)
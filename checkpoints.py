@@ -0,0 +1,138 @@
+import os
+import pickle
+import time
+
+# Results files of the experiments: append-only files of pickled records. A record is a dictionnary holding the
+# list "units" of the work units it covers, the summed "counts" of these units and the "seed" of the run they belong
+# to. The records are written by RecordWriter, which sums the counts of the units of a group (the units of one
+# number of agents, ...) completed since its last write into one record, so that the file grows with the number of
+# writes rather than with the number of units
+
+# Yields the records of the results file path (none if it does not exist) one by one, each with the offset of its
+# end. A run stopped while writing can leave a truncated last record, which is ignored: reading it runs out of data
+# at the end of the file. Any other failure to read a record raises, so that a damaged file is not cut
+def readRecordsAndEnds(path):
+	if not os.path.exists(path):
+		return
+	with open(path, "rb") as file:
+		size = os.fstat(file.fileno()).st_size
+		while True:
+			try:
+				record = pickle.load(file)
+			except (EOFError, pickle.UnpicklingError):
+				if file.tell() < size:
+					raise
+				return
+			yield (record, file.tell())
+
+# Yields the records of the results file path one by one, see readRecordsAndEnds
+def readRecords(path):
+	for (record, _) in readRecordsAndEnds(path):
+		yield record
+
+# Returns the offset of the end of the last complete record of the results file path
+def recordsEnd(path):
+	end = 0
+	for (_, end) in readRecordsAndEnds(path):
+		pass
+	return end
+
+# Cuts the results file path after its last complete record, which ends at end (found by reading the file if None),
+# so that the records appended next can be read back
+def truncatePartialRecord(path, end = None):
+	if not os.path.exists(path):
+		return
+	if end is None:
+		end = recordsEnd(path)
+	if os.path.getsize(path) > end:
+		print("Removing the truncated last record of {}.".format(path))
+		with open(path, "r+b") as file:
+			file.truncate(end)
+
+# Appends the records to the results file path and makes sure they are written to disk
+def appendRecords(path, records):
+	if len(records) == 0:
+		return
+	with open(path, "ab") as file:
+		for record in records:
+			pickle.dump(record, file)
+		file.flush()
+		os.fsync(file.fileno())
+
+# Returns the sum of the counts total and counts, which are numbers, arrays or objects with an addition, or tuples
+# and dictionnaries of them summed term by term. None stands for an empty sum
+def addCounts(total, counts):
+	if total is None:
+		return counts
+	if counts is None:
+		return total
+	if isinstance(counts, dict):
+		return {key: addCounts(total.get(key), counts.get(key)) for key in list(total) + [key for key in counts if key not in total]}
+	if isinstance(counts, tuple):
+		return tuple(addCounts(totalTerm, term) for totalTerm, term in zip(total, counts))
+	return total + counts
+
+# Returns whether the record of the results file path is kept when only the work units of units (all of them if
+# None) are wanted and the units of seenUnits are already counted, adding its units to seenUnits if so. A record is
+# kept if all its units are wanted and none of them is counted yet. A work unit of a seeded run is counted only once
+# over all the files, since two records with the same seed and unit hold the same draw of profiles, while the work
+# units of unseeded records are counted once per file
+def keepRecord(path, record, units, seenUnits):
+	if units is not None and any(unit not in units for unit in record["units"]):
+		return False
+	seed = record.get("seed")
+	keys = {(path if seed is None else seed, unit) for unit in record["units"]}
+	if not seenUnits.isdisjoint(keys):
+		return False
+	seenUnits.update(keys)
+	return True
+
+# Yields the records of all the results files of paths that are kept by keepRecord for the work units of units
+def shardRecords(paths, units = None):
+	seenUnits = set()
+	for path in paths:
+		for record in readRecords(path):
+			if keepRecord(path, record, units, seenUnits):
+				yield record
+
+# Reads the results file path in a single pass before a run. Returns the set of the master seeds of its records, the
+# list of its records kept by keepRecord for the work units of units and the offset of the end of its last complete
+# record
+def scanRecords(path, units = None):
+	seeds = set()
+	records = []
+	seenUnits = set()
+	end = 0
+	for (record, end) in readRecordsAndEnds(path):
+		seeds.add(record.get("seed"))
+		if keepRecord(path, record, units, seenUnits):
+			records.append(record)
+	return (seeds, records, end)
+
+# Sums the counts of the completed work units of a run by group and appends one record per group to the results
+# file path every interval seconds. The partial record a crashed run may have left at the end of the file, whose
+# last complete record ends at end, is removed first
+class RecordWriter:
+	def __init__(self, path, interval, seed = None, end = None):
+		truncatePartialRecord(path, end)
+		self.path = path
+		self.interval = interval
+		self.seed = seed
+		# The work units and the summed counts of each group since the last write
+		self.pending = {}
+		self.lastWrite = time.monotonic()
+
+	# Adds the counts of the work unit to its group, by default the prefix of the unit without its index
+	def add(self, unit, counts, group = None):
+		if group is None:
+			group = unit[:-1]
+		(units, total) = self.pending.get(group, ([], None))
+		units.append(unit)
+		self.pending[group] = (units, addCounts(total, counts))
+		if time.monotonic() - self.lastWrite >= self.interval:
+			self.flush()
+
+	def flush(self):
+		appendRecords(self.path, [{"units": units, "seed": self.seed, "counts": total} for (units, total) in self.pending.values()])
+		self.pending = {}
+		self.lastWrite = time.monotonic()
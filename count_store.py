@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+
+# Stores of the raw counts of the experiments. A store is a directory of chunks, npz files holding one count array
+# per table and number of agents under the key "<table>/<numAgents>", together with a JSON schema giving the version
+# of the format and, for every table, the names indexing the leading axes of its arrays (the criteria, the effects,
+# ...). A run writes its counts as chunks named after its master seed and the work units they hold (the numbers of
+# agents, ...), so that running the same units again replaces their chunk while the chunks of the other units of
+# the same seed are kept. The counts of a table are the sums over all the chunks of the stores that are read, which
+# combines separate runs, and only the arrays of the tables and numbers of agents that are asked for are loaded
+
+COUNT_STORE_VERSION = 1
+
+# Returns the path of the chunk name of the store path
+def chunkPath(path, name):
+	return os.path.join(path, name + ".npz")
+
+# Returns the paths of the chunks of the store path, in a fixed order
+def storeChunks(path):
+	if not os.path.isdir(path):
+		return []
+	return [os.path.join(path, fileName) for fileName in sorted(os.listdir(path)) if fileName.endswith(".npz")]
+
+# Writes the chunk name of the store path, of the given kind ("frequency", "manipulation", ...). tables maps the name
+# of every table to a pair (axes, counts): axes is the list of the (axis name, labels) of the leading axes of the
+# arrays and counts maps the numbers of agents to the count arrays. The chunk is written to a temporary file first,
+# so that a store never holds a partial chunk
+def writeCountChunk(path, kind, name, tables):
+	os.makedirs(path, exist_ok = True)
+	schema = {"version": COUNT_STORE_VERSION, "kind": kind,
+		"tables": {table: {"axes": [[axis, [str(label) for label in labels]] for axis, labels in axes]} for table, (axes, _) in tables.items()}}
+	arrays = {"schema": np.array(json.dumps(schema))}
+	for table, (_, counts) in tables.items():
+		for numAgents, array in counts.items():
+			arrays["{}/{}".format(table, numAgents)] = np.asarray(array, dtype = np.int64)
+	temporaryFile = "{}.{}.tmp.npz".format(chunkPath(path, name)[:-4], os.getpid())
+	np.savez_compressed(temporaryFile, **arrays)
+	os.replace(temporaryFile, chunkPath(path, name))
+
+# Returns the schema of the chunk opened as file, checking its version and kind
+def chunkSchema(file, kind, chunk):
+	schema = json.loads(str(file["schema"]))
+	if schema["version"] != COUNT_STORE_VERSION:
+		raise ValueError("The chunk {} has version {} of the count store format, version {} is expected.".format(chunk,
+			schema["version"], COUNT_STORE_VERSION))
+	if schema["kind"] != kind:
+		raise ValueError("The chunk {} holds {} counts, not {} counts.".format(chunk, schema["kind"], kind))
+	return schema
+
+# Returns the summed count arrays of table over all the chunks of the stores of paths, as a dictionnary mapping the
+# numbers of agents to the arrays, and the (axis name, labels) of their leading axes. Only the numbers of agents of
+# numAgentsList (all of them if None) are read, and select maps axis names to the labels to keep along them, in that
+# order. Chunks whose labels are in a different order are aligned on the first chunk
+def readCountTable(paths, kind, table, numAgentsList = None, select = None):
+	sums = {}
+	axes = None
+	for path in paths:
+		for chunk in storeChunks(path):
+			with np.load(chunk) as file:
+				schema = chunkSchema(file, kind, chunk)
+				if table not in schema["tables"]:
+					continue
+				chunkAxes = schema["tables"][table]["axes"]
+				if axes is None:
+					axes = [[axis, labels if select is None or axis not in select else [str(label) for label in select[axis]]]
+						for axis, labels in chunkAxes]
+				# Positions, in the arrays of the chunk, of the labels that are kept
+				indices = []
+				for (axis, labels), (chunkAxis, chunkLabels) in zip(axes, chunkAxes):
+					missing = set(labels) - set(chunkLabels)
+					if axis != chunkAxis or len(missing) > 0:
+						raise ValueError("The axis {} of the table {} of the chunk {} does not have the labels {}.".format(axis, table,
+							chunk, sorted(missing)))
+					indices.append([chunkLabels.index(label) for label in labels])
+				prefix = table + "/"
+				for key in file.files:
+					if not key.startswith(prefix) or (numAgentsList is not None and int(key[len(prefix):]) not in numAgentsList):
+						continue
+					array = file[key]
+					for axis, axisIndices in enumerate(indices):
+						array = np.take(array, axisIndices, axis = axis)
+					n = int(key[len(prefix):])
+					sums[n] = sums[n] + array if n in sums else array
+	return (sums, axes)
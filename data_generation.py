@@ -1,13 +1,23 @@
-from itertools import product
+from itertools import combinations_with_replacement, islice, permutations, product
+from collections import Counter
+from math import factorial
 
 import random
 import dill
 
 import numpy as np
 
+from bit_ballots import *
+from ballot_catalogue import *
+from kernels import kernels_enabled, transitivity_kernel
+
 # Returns True or False depending on whether the preference given in input satisfies 
 # transitivity or not
 def check_transitivity(pref):
+	if isinstance(pref, PackedBallot):
+		return packed_is_transitive(pref)
+	if kernels_enabled() and isinstance(pref, np.ndarray):
+		return transitivity_kernel(pref)
 	for k in range(0, len(pref)):
 		for q in range(0, len(pref)):
 			for r in range(0, len(pref)):
@@ -27,40 +37,214 @@ def fix_symmetry_diagonal(pref):
 				fixed_pref[q][j] = 0
 	return fixed_pref
 
-# Randomly generates incomplete preference with alt_number alternatives
-def generate_incomplete_random_preference(alt_number):
-	random_pref = np.random.randint(-1, 2, (alt_number, alt_number))
+# Randomly generates incomplete preference with alt_number alternatives, using the generator rng or the global
+# numpy state
+def generate_incomplete_random_preference(alt_number, rng = None):
+	randint = np.random.randint if rng is None else rng.integers
+	random_pref = randint(-1, 2, (alt_number, alt_number))
 	some_pref = fix_symmetry_diagonal(random_pref)
 	while not check_transitivity(some_pref):
-		random_pref = np.random.randint(-1, 2, (alt_number, alt_number))
+		random_pref = randint(-1, 2, (alt_number, alt_number))
 		some_pref = fix_symmetry_diagonal(random_pref)
 	return some_pref
 
-# Randomly generates a profile of incomplete preferences with n voters and m alternatives
-def profile_generation(n, m):
-	vot_number = n
-	alt_number = m
-	profile = []
-	for _ in range(vot_number):
-		some_pref = generate_incomplete_random_preference(alt_number)
-		profile.append(some_pref)
-	return profile
-
-# Generates all incomplete preferences with numAlts alternatives by looping through all possible 
-# completions of the triangle below the diagonal in the matrix representing the preferences
-def getAllBallots(numAlts):
-	lenLowerDiagonal = int(numAlts * (numAlts - 1) / 2)
-	for lowerDiagonal in product([-1, 0, 1], repeat = lenLowerDiagonal):
-		ballot = np.zeros((numAlts, numAlts))
-		k = 0
-		for i in range(numAlts):
-			for j in range(i):
-				ballot[i][j] = lowerDiagonal[k]
-				k += 1
-		ballot = fix_symmetry_diagonal(ballot)
-		if check_transitivity(ballot):
-			yield ballot
-
-# Returns all the profiles with numVoters voters and numAlts alternatives
-def getAllProfiles(numVoters, numAlts):
-	return product(getAllBallots(numAlts), repeat = numVoters)
\ No newline at end of file
+# Randomly generates numProfiles profiles of incomplete preferences with n voters and m alternatives as an int8
+# array of shape (numProfiles, n, m, m). The ballots are drawn uniformly from the ballot catalogue, which is the
+# distribution of generate_incomplete_random_preference: it draws uniform values in {-1, 0, 1} below the
+# diagonal until the ballot is transitive, so all the transitive ballots are equally likely. Uses the generator
+# rng or the global numpy state
+def profile_generation_batch(numProfiles, n, m, rng = None):
+	return catalogue_ballots(m, sample_catalogue_indices(m, (numProfiles, n), rng))
+
+# Randomly generates a profile of incomplete preferences with n voters and m alternatives, as a PackedProfile
+# if packed is True and as a list of int8 ballots otherwise, using the generator rng or the global numpy state. The
+# ballots are drawn uniformly from the ballot catalogue as for profile_generation_batch
+def profile_generation(n, m, packed = False, rng = None):
+	indices = sample_catalogue_indices(m, n, rng)
+	if packed:
+		return catalogue_packed_profile(m, indices)
+	return list(catalogue_ballots(m, indices))
+
+# Generates all incomplete preferences with numAlts alternatives, in the order of the ballot catalogue. The
+# ballots are given as PackedBallot if packed is True
+def getAllBallots(numAlts, packed = False):
+	for ballot in catalogue_ballots(numAlts, np.arange(catalogue_size(numAlts))):
+		yield pack_ballot(ballot) if packed else ballot
+
+# Returns all the profiles with numVoters voters and numAlts alternatives, as PackedProfile if packed is True
+def getAllProfiles(numVoters, numAlts, packed = False):
+	if packed:
+		ballots = list(getAllBallots(numAlts, packed = True))
+		return (PackedProfile([b.beats for b in profile], [b.beaten for b in profile], numAlts)
+			for profile in product(ballots, repeat = numVoters))
+	return product(getAllBallots(numAlts), repeat = numVoters)
+
+# Returns the table of the images of the ballots under the permutations of the alternatives: the entry [s][b] is
+# the index in ballots of the ballot b once the alternative i has been renamed perms[s][i]
+def ballotPermutationTable(ballots, perms):
+	index = {np.asarray(ballot, dtype = np.int8).tobytes(): b for b, ballot in enumerate(ballots)}
+	table = np.zeros((len(perms), len(ballots)), dtype = np.int64)
+	for s, perm in enumerate(perms):
+		inverse = np.argsort(perm)
+		for b, ballot in enumerate(ballots):
+			image = np.asarray(ballot, dtype = np.int8)[np.ix_(inverse, inverse)]
+			table[s][b] = index[image.tobytes()]
+	return table
+
+# Returns all the profiles with numVoters voters and numAlts alternatives up to a permutation of the voters and,
+# if neutral is True, up to a renaming of the alternatives. Yields pairs (profile, weight) where profile is the
+# canonical representative of its class (the lexicographically smallest sorted tuple of ballot indices) and
+# weight is the number of ordered profiles in the class, so that the weights sum to the number of profiles
+# returned by getAllProfiles. Renaming the alternatives does not commute with the dynamics for a fixed update
+# order, so the neutral reduction is opt-in and only exact for quantities that do not depend on the names of the
+# alternatives. The ballots of the profiles are shared between profiles and should not be modified in place
+def getAllProfileOrbits(numVoters, numAlts, neutral = False, chunkSize = 100000):
+	ballots = list(getAllBallots(numAlts))
+	perms = list(permutations(range(numAlts))) if neutral else [tuple(range(numAlts))]
+	table = ballotPermutationTable(ballots, perms)
+	orbitMin = table.min(axis = 0)
+	numVotersPerms = factorial(numVoters)
+	for first in range(len(ballots)):
+		if orbitMin[first] != first:
+			continue
+		# All the ballots of a canonical profile have an orbit that does not go below its first ballot
+		candidates = [b for b in range(first, len(ballots)) if orbitMin[b] >= first]
+		others = combinations_with_replacement(candidates, numVoters - 1)
+		chunk = list(islice(others, chunkSize))
+		while len(chunk) > 0:
+			indices = np.array([(first,) + other for other in chunk], dtype = np.int64).reshape(len(chunk), numVoters)
+			images = np.sort(table[:, indices], axis = -1)
+			differences = images - indices[None]
+			nonZero = differences != 0
+			firstDifference = np.take_along_axis(differences, np.argmax(nonZero, axis = -1)[..., None], axis = -1)[..., 0]
+			smaller = nonZero.any(axis = -1) & (firstDifference < 0)
+			stabilizer = (~nonZero.any(axis = -1)).sum(axis = 0)
+			for k in np.flatnonzero(~smaller.any(axis = 0)):
+				multiplicities = Counter(indices[k]).values()
+				weight = (len(perms) // stabilizer[k]) * numVotersPerms
+				for multiplicity in multiplicities:
+					weight //= factorial(multiplicity)
+				yield ([ballots[b] for b in indices[k]], weight)
+			chunk = list(islice(others, chunkSize))
+
+# A profile given by its distinct ballots, an array of shape (num_ballots, m, m), and the number of voters
+# submitting each of them. Its length is the number of voters and indexing it by a voter gives the ballot of the
+# voter, the voters being ordered ballot by ballot
+class WeightedProfile:
+	__slots__ = ("ballots", "multiplicities", "voterBounds")
+
+	def __init__(self, ballots, multiplicities):
+		self.ballots = np.asarray(ballots)
+		self.multiplicities = np.asarray(multiplicities, dtype = np.int64)
+		self.voterBounds = np.cumsum(self.multiplicities)
+
+	def __len__(self):
+		return int(self.voterBounds[-1]) if len(self.voterBounds) > 0 else 0
+
+	def __getitem__(self, voter):
+		if voter < 0:
+			voter += len(self)
+		return self.ballots[np.searchsorted(self.voterBounds, voter, side = "right")]
+
+	def __iter__(self):
+		for ballot, multiplicity in zip(self.ballots, self.multiplicities):
+			for _ in range(multiplicity):
+				yield ballot
+
+	def __repr__(self):
+		return "WeightedProfile({} voters, {} distinct ballots)".format(len(self), len(self.ballots))
+
+# Returns the WeightedProfile of the profile given as a list (or array) of ballots
+def weighted_profile(profile):
+	profile = np.asarray(profile, dtype = np.int8)
+	(ballots, multiplicities) = np.unique(profile, axis = 0, return_counts = True)
+	return WeightedProfile(ballots, multiplicities)
+
+# Returns the profile, as an array of shape (voters, m, m), with all the voters of the WeightedProfile prof
+def expand_weighted_profile(prof):
+	return np.repeat(prof.ballots, prof.multiplicities, axis = 0)
+
+# Randomly generates a WeightedProfile with n voters and m alternatives. The ballots are uniformly distributed
+# over the transitive ones, as for profile_generation, so the multiplicities are drawn from a multinomial
+# distribution, in time independent of n. Uses the generator rng or the global numpy state
+def weighted_profile_generation(n, m, rng = None):
+	numBallots = catalogue_size(m)
+	multiplicities = (np.random if rng is None else rng).multinomial(n, np.full(numBallots, 1 / numBallots))
+	drawn = np.flatnonzero(multiplicities)
+	return WeightedProfile(catalogue_ballots(m, drawn), multiplicities[drawn])
+
+# Returns a generator for random profiles, generated by chunks of chunkSize profiles with the generator rng or
+# the global numpy state
+def randomProfiles(numAgents, numAlts, numProfiles, chunkSize = 1000, rng = None):
+	for start in range(0, numProfiles, chunkSize):
+		for profile in profile_generation_batch(min(chunkSize, numProfiles - start), numAgents, numAlts, rng):
+			yield profile
+
+# Useless function to just get the right number of arguments to plug it in the experiment functions
+def allProfiles(numAgents, numAlts, numProfiles, rng = None):
+	return getAllProfiles(numAgents, numAlts)
+
+# All the profiles up to a permutation of the voters, with their weights, to be used with weighted = True. The
+# alternatives are not renamed since the dynamics depend on their names through the update order
+def allProfileOrbits(numAgents, numAlts, numProfiles, rng = None):
+	return getAllProfileOrbits(numAgents, numAlts)
+
+# Tables of the stratified sampling already computed by this process
+_completenessTables = {}
+
+# Returns the tables used to sample profiles of numAgents ballots over numAlts alternatives by completeness level:
+# the number of profiles for each completeness numerator (the number of decided pairs over all the ballots) as exact
+# integers, the number of catalogue ballots for each number of decided pairs, and for each voter k, each number t
+# of pairs left to decide by the voters k, ..., numAgents - 1 and each number d, the probability that voter k
+# decides at most d pairs, as a cumulative array of shape (numAgents, numAgents * numPairs + 1, numPairs + 1)
+def completenessTables(numAgents, numAlts):
+	if (numAgents, numAlts) not in _completenessTables:
+		numPairs = numAlts * (numAlts - 1) // 2
+		ballotCounts = [int(c) for c in np.bincount(catalogue_decided_pairs(numAlts), minlength = numPairs + 1)]
+		# suffixCounts[k][t] is the number of ways for the voters k, ..., numAgents - 1 to decide t pairs
+		suffixCounts = [[0] * (numAgents * numPairs + 1) for _ in range(numAgents + 1)]
+		suffixCounts[numAgents][0] = 1
+		for k in range(numAgents - 1, -1, -1):
+			for t in range((numAgents - k) * numPairs + 1):
+				suffixCounts[k][t] = sum(ballotCounts[d] * suffixCounts[k + 1][t - d] for d in range(min(t, numPairs) + 1))
+		cumulative = np.ones((numAgents, numAgents * numPairs + 1, numPairs + 1))
+		for k in range(numAgents):
+			for t in range(numAgents * numPairs + 1):
+				if suffixCounts[k][t] > 0:
+					probabilities = [ballotCounts[d] * suffixCounts[k + 1][t - d] / suffixCounts[k][t] if d <= t else 0 for d in range(numPairs + 1)]
+					cumulative[k, t] = np.cumsum(probabilities) / sum(probabilities)
+		_completenessTables[(numAgents, numAlts)] = (suffixCounts[0], np.array(ballotCounts), cumulative)
+	return _completenessTables[(numAgents, numAlts)]
+
+# Returns the exact number of profiles of numAgents ballots over numAlts alternatives for each completeness
+# numerator, between 0 and numAgents * numAlts * (numAlts - 1) / 2
+def completenessLevelCounts(numAgents, numAlts):
+	return list(completenessTables(numAgents, numAlts)[0])
+
+# Returns a generator for profiles drawn uniformly at random among the profiles whose completeness numerator is in
+# levels, generated by chunks of chunkSize profiles with the generator rng or the global numpy state. The numerator
+# is drawn with its probability among levels, then the number of decided pairs of each voter given the number left
+# to the next voters, and finally a ballot of the catalogue among the ones with that number of decided pairs, so
+# all the profiles of the levels are equally likely
+def stratifiedProfiles(numAgents, numAlts, numProfiles, levels, chunkSize = 1000, rng = None):
+	(levelCounts, ballotCounts, cumulative) = completenessTables(numAgents, numAlts)
+	levels = np.array([level for level in levels if levelCounts[level] > 0], dtype = np.int64)
+	if len(levels) == 0:
+		raise ValueError("No profile of {} agents over {} alternatives has these completeness levels".format(numAgents, numAlts))
+	levelTotal = sum(levelCounts[level] for level in levels)
+	levelCumulative = np.cumsum([levelCounts[level] / levelTotal for level in levels])
+	levelCumulative /= levelCumulative[-1]
+	# Catalogue indices sorted by number of decided pairs, and the position of the first one of each number
+	ballotsByPairs = np.argsort(catalogue_decided_pairs(numAlts), kind = "stable")
+	firstBallot = np.concatenate(([0], np.cumsum(ballotCounts)[:-1]))
+	random = np.random.random if rng is None else rng.random
+	for start in range(0, numProfiles, chunkSize):
+		size = min(chunkSize, numProfiles - start)
+		remaining = levels[(random(size)[:, None] >= levelCumulative).sum(axis = 1)]
+		indices = np.zeros((size, numAgents), dtype = np.int64)
+		for k in range(numAgents):
+			decided = (random(size)[:, None] >= cumulative[k, remaining]).sum(axis = 1)
+			indices[:, k] = ballotsByPairs[firstBallot[decided] + (random(size) * ballotCounts[decided]).astype(np.int64)]
+			remaining -= decided
+		for profile in catalogue_ballots(numAlts, indices):
+			yield profile
@@ -1,16 +1,26 @@
 from data_generation import *
 from maj_dynamics import *
 from plot import *
-
-from itertools import chain, combinations, permutations
+from checkpoints import *
+from parallel import *
+from outcome_cache import *
+from profiling import *
+from progress import *
+from count_store import *
+
+from itertools import chain, combinations, islice, permutations
+from functools import partial
 from multiprocessing import Pool
-from copy import deepcopy
+from copy import copy, deepcopy
 
 import pandas as pd
 
+import os
 import time
 
-# The list of all the criteria
+from statistics import NormalDist
+
+# The list of all the criteria, in the order of criteria_names used by the fused evaluators
 def criteriaList():
 	return [condorcet, unanDominant, majDominant, plurDominant, plurUndom, unanUndom, majUndom]
 
@@ -18,132 +28,649 @@ def criteriaList():
 def effectList():
 	return ["Good", "Ok", "Bad", "Terrible"]
 
+# Returns the names of the criteria of criterias (a list of criteria), of all the criteria if it is None
+def criteriaNames(criterias = None):
+	return [criteria.__name__ for criteria in (criteriaList() if criterias is None else criterias)]
+
+# Returns the values of the ballots above the diagonal for each profile of the array profiles of shape
+# (num_profiles, voters, m, m), as an array of shape (num_profiles, voters, m * (m - 1) / 2)
+def upperTriangles(profiles):
+	numAlts = profiles.shape[-1]
+	(upperRows, upperColumns) = np.triu_indices(numAlts, 1)
+	return profiles[..., upperRows, upperColumns]
+
+# Returns the number of decided pairs of alternatives over all the ballots of each profile of the array profiles
+# of shape (num_profiles, voters, m, m), i.e., the numerator of the completeness level of the profiles
+def completenessNumerators(profiles):
+	return (upperTriangles(profiles) != 0).sum(axis = (-2, -1))
+
+# Returns the number of pairs of voters and pairs of alternatives on which the two voters disagree for each
+# profile of the array profiles of shape (num_profiles, voters, m, m), i.e., the numerator of the disagreement
+# level of the profiles. For each pair of alternatives, the pairs of voters that agree are the ones with the same
+# value, so counting the voters with each value is enough
+def disagreementNumerators(profiles):
+	numAgents = profiles.shape[-3]
+	upper = upperTriangles(profiles)
+	agreeing = sum((upper == value).sum(axis = -2) * ((upper == value).sum(axis = -2) - 1) // 2 for value in [-1, 0, 1])
+	return (numAgents * (numAgents - 1) // 2 - agreeing).sum(axis = -1)
+
+# Computes the completeness score of each profile of the array profiles of shape (num_profiles, voters, m, m)
+def proportionCompletenessBatch(profiles):
+	profiles = np.asarray(profiles)
+	(numAgents, numAlts) = profiles.shape[-3:-1]
+	return completenessNumerators(profiles) / max(1, numAgents * numAlts * (numAlts - 1) // 2)
+
+# Computes the disagreement score of each profile of the array profiles of shape (num_profiles, voters, m, m)
+def proportionDisagreementBatch(profiles):
+	profiles = np.asarray(profiles)
+	(numAgents, numAlts) = profiles.shape[-3:-1]
+	return disagreementNumerators(profiles) / max(1, (numAgents * (numAgents - 1) // 2) * (numAlts * (numAlts - 1) // 2))
+
 # Computes the completeness score of a profile
 def proportionCompleteness(profile):
-	res = 0
-	numAlts = len(profile[0][0])
-	normalisation = 0
-	for ballot in profile:
-		for i in range(numAlts):
-			for j in range(i + 1, numAlts):
-				normalisation += 1
-				if ballot[i][j] in [-1, 1]:
-					res += 1
-	normalisation = max(1, normalisation)
-	return res / normalisation
+	return float(proportionCompletenessBatch(np.asarray(profile)[None])[0])
 
 # Compute the disagreement score of a profile
 def proportionDisagreement(profile):
-	res = 0
-	numAgents = len(profile)
-	numAlts = len(profile[0][0])
-	normalisation = 0
-	for i1 in range(numAgents):
-		for i2 in range(i1 + 1, numAgents):
-			for j1 in range(numAlts):
-				for j2 in range(j1 + 1, numAlts):
-					normalisation += 1
-					if profile[i1][j1][j2] != profile[i2][j1][j2]:
-						res += 1
-	normalisation = max(1, normalisation)
-	return res / normalisation
+	return float(proportionDisagreementBatch(np.asarray(profile)[None])[0])
+
+# Returns the index in effectList of the effect of the dynamics given the consensus before and after, both
+# being boolean arrays
+def effectIndices(consensusBefore, consensusAfter):
+	return 2 * (1 - consensusAfter.astype(np.int64)) + consensusBefore.astype(np.int64)
+
+# Returns the consensus of all the criteria before and after the dynamics following updateOrder for each profile
+# of the array profiles of shape (num_profiles, voters, m, m), as two boolean arrays of shape (num_profiles, 7).
+# The stages are recorded by profiler if it is given
+def consensusBeforeAfter(profiles, updateOrder, profiler = None):
+	with profiledStage(profiler, "update"):
+		(finalProfiles, finalMajorities) = update_batch(profiles, updateOrder, return_majority = True, profiler = profiler)
+	# The seven criteria are evaluated together by the fused evaluator
+	with profiledStage(profiler, "criteria"):
+		(consensusBefore, _) = all_criteria_batch(profiles)
+		(consensusAfter, _) = all_criteria_batch(finalProfiles, finalMajorities)
+	return (consensusBefore, consensusAfter)
+
+# Same as consensusBeforeAfter, the outcomes of the profiles already in the OutcomeCache cache being taken from it.
+# The other profiles go through the dynamics together, once per distinct profile up to the order of the voters. An
+# outcome is stored as an int whose bits are the consensus of the criteria before, then after the dynamics, which
+# keeps the cache small and cheap to send to the shared outcomes
+def cachedConsensusBeforeAfter(profiles, updateOrder, cache, profiler = None):
+	numAlts = profiles.shape[-1]
+	numCriteria = len(criteriaList())
+	with profiledStage(profiler, "cache lookup"):
+		keys = [(numAlts,) + tuple(ids) for ids in np.sort(catalogue_index(profiles), axis = 1).tolist()]
+		outcomes = cache.getMany(keys)
+	missing = {}
+	for p, (key, outcome) in enumerate(zip(keys, outcomes)):
+		if outcome is None and key not in missing:
+			missing[key] = p
+	if len(missing) > 0:
+		(consensusBefore, consensusAfter) = consensusBeforeAfter(profiles[list(missing.values())], updateOrder, profiler)
+		bits = np.concatenate([consensusBefore, consensusAfter], axis = 1).astype(np.int64) << np.arange(2 * numCriteria)
+		for key, outcome in zip(missing, bits.sum(axis = 1).tolist()):
+			missing[key] = outcome
+		cache.putMany(list(missing.items()))
+	outcomes = np.array([outcome if outcome is not None else missing[key] for key, outcome in zip(keys, outcomes)], dtype = np.int64)
+	consensus = ((outcomes[:, None] >> np.arange(2 * numCriteria)) & 1).astype(bool)
+	return (consensus[:, :numCriteria], consensus[:, numCriteria:])
 
 # The main function for the experiment about the frequency of each effects
-def frequencyExperiment(numAgents, numAlts, numTry, profileFunction):
-	# Initialize dictionnary for the frequency depending on the number of agents
-	resFrequencyAgents = {(numAgents, criteria.__name__, effect): 0
-		for criteria in criteriaList() for effect in effectList()}
-	# Initialize dictionnary for the frequency depending on the completeness level of the profile
-	resFrequencyCompleteness  = {}
-	distinctFrequencyLevel = set()
-
-	print((numAgents, numAlts, numTry))
-	
+# The profiles are processed by chunks of batchSize profiles that go through the dynamics together. If weighted
+# is True, profileFunction yields pairs (profile, weight) and each profile counts for weight profiles. Returns
+# numAgents together with two arrays of counts: the first one is indexed by criterion (in the order of
+# criteriaList) and effect (in the order of effectList), the second one has an extra last axis for the
+# numerator of the completeness level of the profiles, between 0 and numAgents * numAlts * (numAlts - 1) / 2,
+# and the third one is a LevelCounts of the numerators of the disagreement level of the profiles. If cache is
+# an OutcomeCache, the profiles already seen up to the order of the voters do not go through the dynamics again. If
+# profiler is a StageProfiler, the time spent in each stage is recorded
+# Counts of the effects by level numerator for the observed levels only, instead of a dense array over all the
+# possible levels: levels is the sorted array of the observed numerators, counts is indexed by criterion, effect and
+# position in levels and numLevels is the number of possible levels. There are numAgents * (numAgents - 1) / 2 *
+# numPairs + 1 disagreement levels, too many for dense arrays to be sent by the workers for large numbers of agents
+class LevelCounts:
+	def __init__(self, levels, counts, numLevels):
+		self.levels = levels
+		self.counts = counts
+		self.numLevels = numLevels
+
+	def __add__(self, other):
+		levels = np.union1d(self.levels, other.levels)
+		counts = np.zeros(self.counts.shape[:-1] + (len(levels),), dtype = np.int64)
+		counts[..., np.searchsorted(levels, self.levels)] += self.counts
+		counts[..., np.searchsorted(levels, other.levels)] += other.counts
+		return LevelCounts(levels, counts, self.numLevels)
+
+	# Returns the dense array of the counts, indexed by criterion, effect and level numerator
+	def dense(self):
+		counts = np.zeros(self.counts.shape[:-1] + (self.numLevels,), dtype = np.int64)
+		counts[..., self.levels] = self.counts
+		return counts
+
+def frequencyExperiment(numAgents, numAlts, numTry, profileFunction, batchSize = 1000, weighted = False, rng = None, cache = None, 
+	profiler = None):
+	numPairs = numAlts * (numAlts - 1) // 2
+	resFrequencyAgents = np.zeros((len(criteriaList()), len(effectList())), dtype = np.int64)
+	resFrequencyCompleteness = np.zeros((len(criteriaList()), len(effectList()), numAgents * numPairs + 1), dtype = np.int64)
+	resFrequencyDisagreement = LevelCounts(np.zeros(0, dtype = np.int64), np.zeros((len(criteriaList()), len(effectList()), 0), dtype = np.int64), 
+		(numAgents * (numAgents - 1) // 2) * numPairs + 1)
+	criteriaIndices = np.arange(len(criteriaList()))[None, :]
+
 	updateOrder = [(i, j) for i in range(numAlts) for j in range(i + 1, numAlts)]
 	
-	for profile in profileFunction(numAgents, numAlts, numTry):
-		
-		# Compute completeness level, if it's a new value, initialize the corresponding dictionnary
-		completenessLevel = proportionCompleteness(profile)
-		if completenessLevel not in distinctFrequencyLevel:
-			distinctFrequencyLevel.add(completenessLevel)
-			for criteria in criteriaList():
-				for effect in effectList():
-					resFrequencyCompleteness[(numAgents, criteria.__name__, completenessLevel, effect)] = 0
-
-		# Profile after the dynamics				
-		finalProfile = update(profile, updateOrder)
-		
-		for criteria in criteriaList():
-
-			# Compute consensus before and after and update the frequency accordingly
-			consensusBefore = criteria(profile)[0]
-			consensusAfter = criteria(finalProfile)[0]
-			if consensusBefore and consensusAfter:
-				resFrequencyAgents[(numAgents, criteria.__name__, "Ok")] += 1
-				resFrequencyCompleteness[(numAgents, criteria.__name__, completenessLevel, "Ok")] += 1
-			elif consensusBefore and not consensusAfter:
-				resFrequencyAgents[(numAgents, criteria.__name__, "Terrible")] += 1
-				resFrequencyCompleteness[(numAgents, criteria.__name__, completenessLevel, "Terrible")] += 1
-			elif not consensusBefore and consensusAfter:
-				resFrequencyAgents[(numAgents, criteria.__name__, "Good")] += 1
-				resFrequencyCompleteness[(numAgents, criteria.__name__, completenessLevel, "Good")] += 1
-			elif not consensusBefore and not consensusAfter:
-				resFrequencyAgents[(numAgents, criteria.__name__, "Bad")] += 1
-				resFrequencyCompleteness[(numAgents, criteria.__name__, completenessLevel, "Bad")] += 1
-
-	return (resFrequencyAgents, resFrequencyCompleteness)
+	if rng is None:
+		profiles = iter(profileFunction(numAgents, numAlts, numTry))
+	else:
+		profiles = iter(profileFunction(numAgents, numAlts, numTry, rng = rng))
+	if not weighted:
+		profiles = ((profile, 1) for profile in profiles)
+	with profiledStage(profiler, "generation"):
+		chunk = list(islice(profiles, batchSize))
+	while len(chunk) > 0:
+		(chunk, weights) = zip(*chunk)
+		weights = np.array(weights, dtype = np.int64)[:, None]
+
+		chunkArray = np.array(chunk, dtype = np.int8)
+		if profiler is not None:
+			profiler.count("profiles", len(chunkArray))
+
+		# Consensus before and after for all the criteria and all the profiles of the chunk, all the profiles of the
+		# chunk being updated at once
+		if cache is None:
+			(allConsensusBefore, allConsensusAfter) = consensusBeforeAfter(chunkArray, updateOrder, profiler)
+		else:
+			(allConsensusBefore, allConsensusAfter) = cachedConsensusBeforeAfter(chunkArray, updateOrder, cache, profiler)
+		effects = effectIndices(allConsensusBefore, allConsensusAfter)
+		with profiledStage(profiler, "completeness"):
+			completenessLevels = completenessNumerators(chunkArray)[:, None]
+		with profiledStage(profiler, "disagreement"):
+			(disagreementLevels, disagreementPositions) = np.unique(disagreementNumerators(chunkArray), return_inverse = True)
+
+		with profiledStage(profiler, "counting"):
+			np.add.at(resFrequencyAgents, (criteriaIndices, effects), weights)
+			np.add.at(resFrequencyCompleteness, (criteriaIndices, effects, completenessLevels), weights)
+			chunkDisagreement = np.zeros((len(criteriaList()), len(effectList()), len(disagreementLevels)), dtype = np.int64)
+			np.add.at(chunkDisagreement, (criteriaIndices, effects, disagreementPositions.reshape(-1, 1)), weights)
+			resFrequencyDisagreement = resFrequencyDisagreement + LevelCounts(disagreementLevels, chunkDisagreement, 
+				resFrequencyDisagreement.numLevels)
+
+		with profiledStage(profiler, "generation"):
+			chunk = list(islice(profiles, batchSize))
+
+	return (numAgents, resFrequencyAgents, resFrequencyCompleteness, resFrequencyDisagreement)
+
+# The function that is called for the pool of processes for the experiment about the frequency of each effect,
+# a work unit being identified by (numAgents, index). The profiles of the unit are drawn from its own generator
+# derived from the master seed. Returns the work unit together with a dictionnary mapping numAgents to its counts, as
+# for frequencyCommonPoolFunction, and the statistics of the worker during the unit (see workerUnitStats)
+def frequencyPoolFunction(unitTrySeed):
+	startingTime = time.perf_counter()
+	(unit, numTry, masterSeed) = unitTrySeed
+	numAlts = 5
+	rng = unitRandomGenerator(masterSeed, unit)
+	cache = currentOutcomeCache()
+	statsBefore = cache.stats() if cache is not None else (0, 0)
+	(numAgents, countsAgents, countsCompleteness, countsDisagreement) = frequencyExperiment(unit[0], numAlts, numTry, randomProfiles, rng = rng, 
+		cache = cache, profiler = currentProfiler())
+	return (unit, {numAgents: (countsAgents, countsCompleteness, countsDisagreement)}, workerUnitStats(cache, statsBefore, startingTime))
 
 # The function that is called for the pool of processes for the experiment about the frequency of each effect
-def frequencyPoolFunction(numAgentsTry):
-	(numAgents, numTry) = numAgentsTry
+# with common profiles, a work unit being identified by (numAgentsMin, numAgentsMax, index). The unit draws numTry
+# profiles of numAgentsMax voters and runs the experiment on their prefixes of numAgentsMin, numAgentsMin + 2, ...,
+# numAgentsMax voters. Returns the work unit together with a dictionnary mapping numAgents to its counts and the
+# statistics of the worker during the unit (see workerUnitStats)
+def frequencyCommonPoolFunction(unitTrySeed):
+	startingTime = time.perf_counter()
+	(unit, numTry, masterSeed) = unitTrySeed
+	(numAgentsMin, numAgentsMax, _) = unit
 	numAlts = 5
-	return frequencyExperiment(numAgents, numAlts, numTry, randomProfiles)
-
-# Runs the experiments about the frequency of each effect in a pool of processes
-def runFrequencyExperiment(numAgentsMax, numTryMax, numAgentsMin = 1):
+	cache = currentOutcomeCache()
+	statsBefore = cache.stats() if cache is not None else (0, 0)
+	profiler = currentProfiler()
+	with profiledStage(profiler, "generation"):
+		profiles = profile_generation_batch(numTry, numAgentsMax, numAlts, unitRandomGenerator(masterSeed, unit))
+	counts = {}
+	for numAgents in range(numAgentsMin, numAgentsMax + 1, 2):
+		(_, countsAgents, countsCompleteness, countsDisagreement) = frequencyExperiment(numAgents, numAlts, numTry, 
+			lambda numAgents, numAlts, numTry: profiles[:, :numAgents], cache = cache, profiler = profiler)
+		counts[numAgents] = (countsAgents, countsCompleteness, countsDisagreement)
+	return (unit, counts, workerUnitStats(cache, statsBefore, startingTime))
+
+# Returns the statistics of the current worker about the work unit that just ended: its process ID, the numbers of
+# hits and misses of its outcome cache since it had the numbers cacheStatsBefore and the snapshot of its profiler
+# (None if profiling is disabled), which is then reset, and the time spent on the unit since startingTime (a value
+# of time.perf_counter)
+def workerUnitStats(cache, cacheStatsBefore, startingTime):
+	profiler = currentProfiler()
+	return {"pid": os.getpid(), "cache": cacheStatsSince(cache, cacheStatsBefore), 
+		"profile": profiler.takeSnapshot() if profiler is not None else None, "seconds": time.perf_counter() - startingTime}
+
+# Initializer of the pool workers of the experiments, creating their outcome cache and their profiler
+def initWorker(cacheSize = None, sharedCache = None, profiling = False):
+	initWorkerOutcomeCache(cacheSize, sharedCache)
+	initWorkerProfiler(profiling)
+
+# Aggregates the statistics returned by the workers for their work units, see workerUnitStats
+class WorkerStatsAggregator:
+	def __init__(self):
+		self.cacheStats = np.zeros(2, dtype = np.int64)
+		self.total = StageProfiler()
+		self.workers = {}
+
+	def add(self, stats):
+		self.cacheStats += stats["cache"]
+		worker = self.workers.setdefault(stats["pid"], {"units": 0, "profiler": StageProfiler()})
+		worker["units"] += 1
+		if stats["profile"] is not None:
+			self.total.merge(stats["profile"])
+			worker["profiler"].merge(stats["profile"])
+
+	# Prints the summary table of the profiles and writes their JSON trace to traceFile
+	def report(self, traceFile, wallSeconds):
+		print(profileSummary(self.total.snapshot()))
+		workers = {pid: {"units": worker["units"], **worker["profiler"].snapshot()} for pid, worker in self.workers.items()}
+		writeProfileTrace(traceFile, self.total.snapshot(), workers, wallSeconds)
+		print("Profile trace written to {}.".format(traceFile))
+
+# Returns the numbers of hits and misses of the outcome cache since it had the numbers statsBefore
+def cacheStatsSince(cache, statsBefore):
+	if cache is None:
+		return (0, 0)
+	return tuple(now - before for now, before in zip(cache.stats(), statsBefore))
+
+# Merges the counts of the records of the frequency experiment, which map numAgents to its counts. Returns three
+# dictionnaries mapping numAgents to the summed count arrays, as expected by frequencyDataFrames
+def mergeFrequencyRecords(records):
+	merged = ({}, {}, {})
+	for record in records:
+		for numAgents, allCounts in record["counts"].items():
+			for res, counts in zip(merged, allCounts):
+				res[numAgents] = res[numAgents] + counts if numAgents in res else counts
+	return merged
+
+# Merges the counts of the results files of the frequency experiment given in paths, possibly coming from
+# different runs, only counting the work units of units if it is not None (see shardRecords and
+# mergeFrequencyRecords)
+def mergeFrequencyShards(paths, units = None):
+	return mergeFrequencyRecords(shardRecords(paths, units))
+
+# Returns the rows of the DataFrame of the raw counts of each effect for each observed level, counts being an
+# array indexed by criterion (the ones named in names, all of them by default), effect and level numerator or a
+# LevelCounts, as returned by frequencyExperiment
+def levelRows(numAgents, counts, levelName, names = None):
+	if isinstance(counts, LevelCounts):
+		(levels, counts, numLevels) = (counts.levels, counts.counts, counts.numLevels)
+	else:
+		(levels, numLevels) = (np.arange(counts.shape[-1]), counts.shape[-1])
+	normalisation = max(1, numLevels - 1)
+	rows = []
+	for position in np.flatnonzero(counts.sum(axis = (0, 1))):
+		for c, criteria in enumerate(criteriaNames() if names is None else names):
+			for e, effect in enumerate(effectList()):
+				rows.append({"numAgents": numAgents, "criteria": criteria, levelName: int(levels[position]) / normalisation,
+					"effect": effect, "frequency": counts[c][e][position]})
+	return rows
+
+# Returns the rows of the DataFrame of the frequency of each effect, with the bounds of its Wilson interval, counts
+# being an array indexed by criterion (the ones named in names, all of them by default) and effect
+def numAgentsRows(numAgents, counts, names = None, confidence = 0.95):
+	(frequencies, lower, upper) = effectFrequencies(counts, confidence)
+	rows = []
+	for c, criteria in enumerate(criteriaNames() if names is None else names):
+		for e, effect in enumerate(effectList()):
+			rows.append({"numAgents": numAgents, "criteria": criteria, "effect": effect, "frequency": frequencies[c][e], 
+				"lower": lower[c][e], "upper": upper[c][e]})
+	return rows
+
+# Returns the lower and upper bounds of the Wilson score intervals at the given confidence level of the
+# proportions successes / trials (arrays of the same shape). The interval is [0, 1] when there is no trial
+def wilsonInterval(successes, trials, confidence = 0.95):
+	z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+	trials = np.asarray(trials, dtype = float)
+	safeTrials = np.where(trials > 0, trials, 1)
+	p = np.asarray(successes, dtype = float) / safeTrials
+	denominator = 1 + z ** 2 / safeTrials
+	center = (p + z ** 2 / (2 * safeTrials)) / denominator
+	halfWidth = z * np.sqrt(np.maximum(p * (1 - p) / safeTrials + z ** 2 / (4 * safeTrials ** 2), 0)) / denominator
+	lower = np.where((trials > 0) & (p > 0), np.clip(center - halfWidth, 0, 1), 0)
+	upper = np.where((trials > 0) & (p < 1), np.clip(center + halfWidth, 0, 1), 1)
+	return (lower, upper)
+
+# Returns the frequencies of the effects for each criterion given the count array of frequencyExperiment indexed
+# by criterion and effect, together with the bounds of their Wilson intervals. The frequencies are normalised
+# among the profiles with (Ok, Terrible) and without (Good, Bad) initial consensus
+def effectFrequencies(counts, confidence = 0.95):
+	effectIndex = {effect: e for e, effect in enumerate(effectList())}
+	trials = np.zeros(counts.shape, dtype = np.int64)
+	for effects in [["Ok", "Terrible"], ["Bad", "Good"]]:
+		columns = [effectIndex[effect] for effect in effects]
+		trials[:, columns] = counts[:, columns].sum(axis = 1, keepdims = True)
+	frequencies = counts / np.where(trials > 0, trials, 1)
+	(lower, upper) = wilsonInterval(counts, trials, confidence)
+	return (frequencies, lower, upper)
+
+# Returns True if the Wilson intervals of all the frequencies of effectFrequencies are narrower than targetWidth.
+# The frequencies conditioned on an event (initial consensus or not for a criterion) so rare that the upper bound
+# of its own interval is below targetWidth are not considered, as they could take forever to estimate
+def frequencyPrecisionReached(counts, targetWidth, confidence = 0.95):
+	effectIndex = {effect: e for e, effect in enumerate(effectList())}
+	(_, lower, upper) = effectFrequencies(counts, confidence)
+	widths = upper - lower
+	numProfiles = counts.sum(axis = 1, keepdims = True)
+	for effects in [["Ok", "Terrible"], ["Bad", "Good"]]:
+		columns = [effectIndex[effect] for effect in effects]
+		(_, eventUpper) = wilsonInterval(counts[:, columns].sum(axis = 1, keepdims = True), numProfiles, confidence)
+		widths[:, columns] = np.where(eventUpper < targetWidth, 0, widths[:, columns])
+	return np.max(widths) <= targetWidth
+
+# Turns the counts of frequencyExperiment, given as dictionnaries mapping numAgents to the count arrays, into the
+# DataFrames of the frequency of each effect. For the number of agents, the frequencies of the effects are
+# normalised among the profiles with (Ok, Terrible) and without (Good, Bad) initial consensus and come with the
+# bounds of their Wilson intervals at the given confidence level, the completeness and disagreement data are kept
+# as raw counts and only contain the levels that have been observed
+def frequencyDataFrames(countsAgents, countsCompleteness, countsDisagreement, confidence = 0.95):
+	rowsAgents = []
+	rowsCompleteness = []
+	rowsDisagreement = []
+	for numAgents in sorted(countsAgents):
+		rowsAgents += numAgentsRows(numAgents, countsAgents[numAgents], confidence = confidence)
+		rowsCompleteness += levelRows(numAgents, countsCompleteness[numAgents], "completeness")
+		rowsDisagreement += levelRows(numAgents, countsDisagreement[numAgents], "disagreement")
+	return (pd.DataFrame(rowsAgents), pd.DataFrame(rowsCompleteness), pd.DataFrame(rowsDisagreement))
+
+# The (axis name, labels) of the leading axes of the count arrays of frequencyExperiment
+def frequencyAxes():
+	return [("criteria", criteriaNames()), ("effect", effectList())]
+
+# Writes the counts of frequencyExperiment, given as dictionnaries mapping numAgents to the count arrays, as the chunk
+# name of the count store path, in the tables "numAgents", "completeness" and "disagreement". The disagreement counts
+# are stored as dense arrays
+def writeFrequencyStore(path, name, countsAgents, countsCompleteness, countsDisagreement):
+	countsDisagreement = {numAgents: counts.dense() if isinstance(counts, LevelCounts) else counts for numAgents, counts in countsDisagreement.items()}
+	writeCountChunk(path, "frequency", name, {"numAgents": (frequencyAxes(), countsAgents), 
+		"completeness": (frequencyAxes(), countsCompleteness), "disagreement": (frequencyAxes(), countsDisagreement)})
+
+# Reads the DataFrame of the frequency of each effect by number of agents, as built by frequencyDataFrames, from the
+# count stores of paths. Only the counts of the numbers of agents of numAgentsList and of the criteria of criterias
+# (all of them if None) are read, the frequencies being computed from the counts summed over the stores
+def loadFrequencyNumAgentsData(paths, numAgentsList = None, criterias = None, confidence = 0.95):
+	(counts, axes) = readCountTable(paths, "frequency", "numAgents", numAgentsList, 
+		{"criteria": criteriaNames(criterias), "effect": effectList()})
+	rows = []
+	for numAgents in sorted(counts):
+		rows += numAgentsRows(numAgents, counts[numAgents], axes[0][1], confidence)
+	return pd.DataFrame(rows)
+
+# Reads the DataFrame of the raw counts of each effect by level of levelName ("completeness" or "disagreement"), as
+# built by frequencyDataFrames, from the count stores of paths, reading only what is needed as for
+# loadFrequencyNumAgentsData
+def loadFrequencyLevelData(paths, levelName = "completeness", numAgentsList = None, criterias = None):
+	(counts, axes) = readCountTable(paths, "frequency", levelName, numAgentsList, 
+		{"criteria": criteriaNames(criterias), "effect": effectList()})
+	rows = []
+	for numAgents in sorted(counts):
+		rows += levelRows(numAgents, counts[numAgents], levelName, axes[0][1])
+	return pd.DataFrame(rows)
+
+# Returns the master seed of the run writing to resultsFile, whose records have the master seeds seeds: the one of
+# the records already in resultsFile if any, otherwise masterSeed or a new seed if it is None
+def runMasterSeed(resultsFile, seeds, masterSeed = None):
+	seeds = set(seeds) - {None}
+	if len(seeds) > 1 or (masterSeed is not None and len(seeds) == 1 and masterSeed not in seeds):
+		raise ValueError("The results file {} was written with the master seeds {}".format(resultsFile, sorted(seeds)))
+	if len(seeds) == 1:
+		masterSeed = seeds.pop()
+	elif masterSeed is None:
+		masterSeed = newMasterSeed()
+	print("Master seed: {}".format(masterSeed))
+	return masterSeed
+
+# Options of the runs of the experiments in a pool of processes:
+# - resultsFile, checkpointInterval: the records of the work units are appended to resultsFile every
+#   checkpointInterval seconds and the units already in it are skipped, so that a stopped run can be resumed
+# - masterSeed: the seed the generators of the units are derived from (see runMasterSeed), numWorkers: the number of
+#   processes (by default the number of CPUs)
+# - cacheSize, sharedCache: the size of the OutcomeCache of every worker, shared through a SharedOutcomeManager if
+#   sharedCache is True, which costs a round trip per chunk and only pays off when few distinct profiles exist
+# - profiling, traceFile: the stages of the workers are printed and written as a JSON trace, see StageProfiler
+# - statusFile, statusInterval: the progress of the run is written every statusInterval seconds, see ProgressReporter
+# - storePath: the count store the counts of the run are written to
+# The files left to None get the default names of the experiment
+class RunOptions:
+	def __init__(self, resultsFile = None, checkpointInterval = 60, masterSeed = None, numWorkers = None, cacheSize = None, 
+		sharedCache = False, profiling = False, traceFile = None, statusFile = None, statusInterval = 30, storePath = None):
+		self.resultsFile = resultsFile
+		self.checkpointInterval = checkpointInterval
+		self.masterSeed = masterSeed
+		self.numWorkers = numWorkers
+		self.cacheSize = cacheSize
+		self.sharedCache = sharedCache
+		self.profiling = profiling
+		self.traceFile = traceFile
+		self.statusFile = statusFile
+		self.statusInterval = statusInterval
+		self.storePath = storePath
+
+	# Returns a copy of the options where the options left to None are given by defaults
+	def withDefaults(self, **defaults):
+		options = copy(self)
+		for name, value in defaults.items():
+			if getattr(options, name) is None:
+				setattr(options, name, value)
+		return options
+
+# The pool of processes of a run with the given RunOptions, together with the writer of its results file, whose
+# records have the master seed masterSeed and whose last complete record ends at end (see RecordWriter), the
+# statistics of its workers and the progress reporter of the units of totals (see ProgressReporter). Used as a
+# context manager, it closes them all and reports on the cache and the profiles of the workers at the end
+class PoolRun:
+	def __init__(self, options, totals, masterSeed, end):
+		self.options = options
+		self.startingTime = time.time()
+		self.manager = None
+		if options.cacheSize and options.sharedCache:
+			self.manager = SharedOutcomeManager()
+			self.manager.start()
+		shared = self.manager.SharedOutcomes(options.cacheSize) if self.manager is not None else None
+		self.pool = Pool(options.numWorkers, initializer = initWorker, initargs = (options.cacheSize, shared, options.profiling))
+		self.writer = RecordWriter(options.resultsFile, options.checkpointInterval, masterSeed, end)
+		self.workerStats = WorkerStatsAggregator()
+		self.progress = ProgressReporter(totals, options.statusFile, options.statusInterval).start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exceptionType, exception, traceback):
+		self.writer.flush()
+		self.pool.close()
+		self.progress.stop()
+		if self.manager is not None:
+			self.manager.shutdown()
+		if exceptionType is None and self.options.cacheSize:
+			print("Outcome cache: {} hits, {} misses.".format(*self.workerStats.cacheStats))
+		if exceptionType is None and self.options.profiling:
+			self.workerStats.report(self.options.traceFile, time.time() - self.startingTime)
+
+	# Returns the results of poolFunction on the tasks, see adaptiveImap
+	def imap(self, poolFunction, tasks):
+		return adaptiveImap(self.pool, poolFunction, tasks, self.options.numWorkers)
+
+	# Records the result of a work unit: its counts for the results file, summed with the ones of the units of its
+	# group (see RecordWriter.add), and the statistics unitStats of its worker, the unit having numProfiles profiles of
+	# the given level of the progress
+	def add(self, unit, counts, level, numProfiles, unitStats, group = None):
+		self.writer.add(unit, counts, group)
+		self.workerStats.add(unitStats)
+		self.progress.add(level, numProfiles, unitStats)
+
+# Runs the experiments about the frequency of each effect for every other number of agents from numAgentsMin to
+# numAgentsMax, with numTryMax profiles each, in work units of 100 profiles run as set by options (see RunOptions).
+# With targetWidth, each number of agents is sampled by rounds of doubling size until its Wilson intervals are
+# narrower (see frequencyPrecisionReached). With commonProfiles, all the numbers of agents are evaluated on the
+# prefixes of the same profiles (see frequencyCommonPoolFunction)
+def runFrequencyExperiment(numAgentsMax, numTryMax, numAgentsMin = 1, targetWidth = None, confidence = 0.95, commonProfiles = False, 
+	options = None):
+	options = (options or RunOptions()).withDefaults(resultsFile = "frequencyCounts.pkl", traceFile = "frequencyProfile.json", 
+		statusFile = "frequencyStatus.json", storePath = "frequencyStore")
 	startingTime = time.time()
-	pool = Pool()
-
-	resFrequencyAgents = {}
-	resFrequencyCompleteness = {}
 	
 	tryPerWorker = 100
-	for res in pool.imap_unordered(frequencyPoolFunction, [(numAgents, tryPerWorker) for numAgents in range(numAgentsMin, numAgentsMax + 1, 2) for i in range(int(numTryMax / tryPerWorker))]):
-		for key, frequency in res[0].items():
-			if key in resFrequencyAgents:
-				resFrequencyAgents[key] += frequency
-			else:
-				resFrequencyAgents[key] = frequency
+	firstRoundUnits = 10
+	numUnits = int(numTryMax / tryPerWorker)
+	numAgentsList = list(range(numAgentsMin, numAgentsMax + 1, 2))
+
+	# The streams of work units, identified by the prefix of the identifiers of their units and mapped to the
+	# numbers of agents they give counts for
+	if commonProfiles:
+		(poolFunction, streams) = (frequencyCommonPoolFunction, {(numAgentsMin, numAgentsMax): numAgentsList})
+	else:
+		(poolFunction, streams) = (frequencyPoolFunction, {(numAgents,): [numAgents] for numAgents in numAgentsList})
+	# The results file can hold the units of other calls with the same master seed, only the ones of this call count
+	requested = {stream + (i,) for stream in streams for i in range(numUnits)}
+	(seeds, records, end) = scanRecords(options.resultsFile, requested)
+	masterSeed = runMasterSeed(options.resultsFile, seeds, options.masterSeed)
+	completed = {unit for record in records for unit in record["units"]}
+	print("{}{} work units to run, {} already completed.".format("At most " if targetWidth is not None else "", 
+		len(requested - completed), len(requested & completed)))
+
+	# Number of work units scheduled so far for each stream that is still sampled, and the counts of the effects
+	# for each number of agents
+	scheduled = {stream: 0 for stream in streams}
+	countsAgents = mergeFrequencyRecords(records)[0]
+
+	streamLevel = lambda stream: "-".join(str(numAgents) for numAgents in stream)
+	totals = {streamLevel(stream): sum(1 for i in range(numUnits) if stream + (i,) not in completed) for stream in streams}
+	with PoolRun(options, totals, masterSeed, end) as run:
+		while len(scheduled) > 0:
+			units = []
+			for stream in scheduled:
+				if targetWidth is None:
+					roundEnd = numUnits
+				else:
+					roundEnd = min(numUnits, max(firstRoundUnits, 2 * scheduled[stream]))
+				units += [stream + (i,) for i in range(scheduled[stream], roundEnd) if stream + (i,) not in completed]
+				scheduled[stream] = roundEnd
+			for (unit, counts, unitStats) in run.imap(poolFunction, [(unit, tryPerWorker, masterSeed) for unit in units]):
+				run.add(unit, counts, streamLevel(unit[:-1]), tryPerWorker * len(streams[unit[:-1]]), unitStats)
+				for numAgents, levelCounts in counts.items():
+					countsAgents[numAgents] = countsAgents[numAgents] + levelCounts[0] if numAgents in countsAgents else levelCounts[0].copy()
+			for stream in list(scheduled):
+				if scheduled[stream] >= numUnits:
+					del scheduled[stream]
+				elif all(numAgents in countsAgents and frequencyPrecisionReached(countsAgents[numAgents], targetWidth, confidence) 
+					for numAgents in streams[stream]):
+					print("Precision reached for {} agents after {} profiles.".format(streams[stream], countsAgents[streams[stream][0]][0].sum()))
+					run.progress.finishLevel(streamLevel(stream))
+					del scheduled[stream]
+
+	counts = mergeFrequencyShards([options.resultsFile], requested)
+	# One chunk per stream, so that a call on other numbers of agents with the same master seed does not replace it
+	for stream, numAgentsOfStream in streams.items():
+		writeFrequencyStore(options.storePath, "run_{}_{}".format(masterSeed, streamLevel(stream)), 
+			*({numAgents: res[numAgents] for numAgents in numAgentsOfStream if numAgents in res} for res in counts))
+	(dataNumAgents, dataCompleteness, dataDisagreement) = frequencyDataFrames(*counts, confidence = confidence)
+	
+	print("Done in {} seconds.".format(time.time() - startingTime))
+	
+	return (dataNumAgents, dataCompleteness, dataDisagreement)
+
+# The function that is called for the pool of processes for the exhaustive frequency experiment, evaluating all the
+# profiles of numAgents voters over numAlts alternatives up to a permutation of the voters, weighted by the size of
+# their class. Returns numAgents together with the counts of frequencyExperiment
+def exhaustivePoolFunction(numAgentsAlts):
+	(numAgents, numAlts) = numAgentsAlts
+	return (numAgents, frequencyExperiment(numAgents, numAlts, 0, allProfileOrbits, weighted = True)[1:])
+
+# Runs the experiments about the frequency of each effect on all the profiles of numAlts alternatives instead of a
+# sample, for the numbers of agents from numAgentsMin to numAgentsMax, each one in a process of the pool. The exact
+# counts are written to the count store of options (by default exhaustiveStore, see RunOptions, whose other options
+# are not used) and turned into DataFrames as for runFrequencyExperiment. There are catalogue_size(numAlts) **
+# numAgents profiles, so this is only feasible for few voters and alternatives
+def runExhaustiveFrequencyExperiment(numAgentsMax, numAlts, numAgentsMin = 1, options = None):
+	options = (options or RunOptions()).withDefaults(storePath = "exhaustiveStore")
+	startingTime = time.time()
+	counts = ({}, {}, {})
+	with Pool(options.numWorkers) as pool:
+		for (numAgents, allCounts) in pool.imap_unordered(exhaustivePoolFunction, 
+			[(numAgents, numAlts) for numAgents in range(numAgentsMin, numAgentsMax + 1, 2)]):
+			for res, levelCounts in zip(counts, allCounts):
+				res[numAgents] = levelCounts
+			writeFrequencyStore(options.storePath, "exhaustive_{}_{}".format(numAlts, numAgents), *({numAgents: levelCounts} for levelCounts in allCounts))
+	(dataNumAgents, dataCompleteness, dataDisagreement) = frequencyDataFrames(*counts)
+	# The frequencies are exact, they have no confidence interval
+	dataNumAgents["lower"] = dataNumAgents["frequency"]
+	dataNumAgents["upper"] = dataNumAgents["frequency"]
 
-		for key, frequency in res[1].items():
-			if key in resFrequencyCompleteness:
-				resFrequencyCompleteness[key] += frequency
-			else:
-				resFrequencyCompleteness[key] = frequency
+	print("Done in {} seconds.".format(time.time() - startingTime))
 
-	pool.close()
+	return (dataNumAgents, dataCompleteness, dataDisagreement)
+
+# Returns the completeness numerators of the profiles of numAgents voters over numAlts alternatives grouped by bins
+# of binSize percents, as a dictionnary mapping the bins to their numerators. The bins are the ones used by
+# frequencyCompletenessPlot with the same binSize
+def completenessBins(numAgents, numAlts, binSize = 5):
+	normalisation = max(1, numAgents * numAlts * (numAlts - 1) // 2)
+	bins = {}
+	for level in range(normalisation + 1):
+		bins.setdefault(round((100 * (level / normalisation)) / binSize) * binSize, []).append(level)
+	return bins
+
+# The function that is called for the pool of processes for the stratified completeness experiment, a work unit
+# being identified by (numAgents, binSize, bin, index, number of profiles) and sampling its profiles among the ones
+# with the completeness numerators levels. Returns the work unit together with its counts by completeness level and the statistics of the
+# worker during the unit
+def completenessPoolFunction(unitTrySeedLevels):
+	startingTime = time.perf_counter()
+	(unit, numTry, masterSeed, levels) = unitTrySeedLevels
+	numAlts = 5
+	rng = unitRandomGenerator(masterSeed, unit)
+	cache = currentOutcomeCache()
+	statsBefore = cache.stats() if cache is not None else (0, 0)
+	(_, _, countsCompleteness, _) = frequencyExperiment(unit[0], numAlts, numTry, partial(stratifiedProfiles, levels = levels), rng = rng, 
+		cache = cache, profiler = currentProfiler())
+	return (unit, countsCompleteness, workerUnitStats(cache, statsBefore, startingTime))
+
+# Runs the experiment about the frequency of each effect by completeness level for numAgents agents, sampling
+# numTryPerBin profiles in every bin of binSize percents of completeness (see completenessBins) instead of letting
+# uniform sampling crowd the middle levels. Within a bin, the profiles are uniformly distributed so that the
+# frequencies computed by frequencyCompletenessPlot with the same binSize are unbiased, but the counts of levels in
+# different bins are not comparable anymore. The run is set by options, see RunOptions
+def runCompletenessExperiment(numAgents, numTryPerBin, binSize = 5, options = None):
+	options = (options or RunOptions()).withDefaults(resultsFile = "completenessCounts_{}.pkl".format(numAgents), 
+		traceFile = "completenessProfile.json", statusFile = "completenessStatus.json", storePath = "completenessStratifiedStore")
+	startingTime = time.time()
+
+	numAlts = 5
+	tryPerWorker = 100
+	if numTryPerBin < 1:
+		raise ValueError("numTryPerBin must be at least 1, got {}".format(numTryPerBin))
+	bins = completenessBins(numAgents, numAlts, binSize)
+	# The last work unit of each bin samples the remaining profiles, the number of profiles being part of the identifier
+	# of the units so that a shorter last unit of a previous call is not taken for a full one
+	numTryOfUnit = lambda i: min(tryPerWorker, numTryPerBin - i * tryPerWorker)
+	requested = {(numAgents, binSize, b, i, numTryOfUnit(i)) for b in bins for i in range(-(-numTryPerBin // tryPerWorker))}
+	(seeds, records, end) = scanRecords(options.resultsFile, requested)
+	masterSeed = runMasterSeed(options.resultsFile, seeds, options.masterSeed)
+	completed = {unit for record in records for unit in record["units"]}
+	tasks = [(unit, unit[-1], masterSeed, bins[unit[2]]) for unit in sorted(requested - completed)]
+	print("{} work units to run over {} bins, {} already completed.".format(len(tasks), len(bins), len(requested & completed)))
+
+	# The full units and the shorter last units are recorded apart, so that the records of the full units are still
+	# complete for the calls with more profiles per bin
+	with PoolRun(options, {str(numAgents): len(tasks)}, masterSeed, end) as run:
+		for (unit, counts, unitStats) in run.imap(completenessPoolFunction, tasks):
+			run.add(unit, counts, str(numAgents), unit[-1], unitStats, group = unit[:2] + unit[-1:])
+
+	countsCompleteness = np.zeros((len(criteriaList()), len(effectList()), numAgents * numAlts * (numAlts - 1) // 2 + 1), dtype = np.int64)
+	for record in shardRecords([options.resultsFile], requested):
+		countsCompleteness += record["counts"]
+	writeCountChunk(options.storePath, "frequency", "run_{}_{}_{}".format(masterSeed, numAgents, binSize), 
+		{"completeness": (frequencyAxes(), {numAgents: countsCompleteness})})
+	dataCompleteness = pd.DataFrame(levelRows(numAgents, countsCompleteness, "completeness"))
 
-	for numAgents in range(numAgentsMin, numAgentsMax + 1, 2):
-		for criteria in criteriaList():
-			norm = sum(resFrequencyAgents[(numAgents, criteria.__name__, effect)] for effect in ["Ok", "Terrible"])
-			if norm > 0:
-				for effect in ["Ok", "Terrible"]:
-					resFrequencyAgents[(numAgents, criteria.__name__, effect)] /= norm
-			norm = sum(resFrequencyAgents[(numAgents, criteria.__name__, effect)] for effect in ["Bad", "Good"])
-			if norm > 0:
-				for effect in ["Bad", "Good"]:
-					resFrequencyAgents[(numAgents, criteria.__name__, effect)] /= norm
-
-	dataNumAgents = pd.DataFrame([{"numAgents": k[0], "criteria": k[1], "effect": k[2], "frequency": v} for k, v in resFrequencyAgents.items()])
-	dataNumAgents.to_pickle("frequencyNumAgentsData.pkl")
-	
-	dataCompleteness = pd.DataFrame([{"numAgents": k[0], "criteria": k[1], "completeness": k[2], "effect": k[3], "frequency": v} for k, v in resFrequencyCompleteness.items()])
-	dataCompleteness.to_pickle("frequencyCompletenessData.pkl")
-	
 	print("Done in {} seconds.".format(time.time() - startingTime))
-	
-	return (dataNumAgents, dataCompleteness)
+
+	return dataCompleteness
 
 # Returns the powerset of an iterable
 def powerset(iterable):
@@ -166,88 +693,243 @@ def allUpdateOrdersFixedTieBreaking(numAlts):
 	for perm in permutations(baseOrder):
 		yield perm
 
+# Calls visit on the final profile and majority matrix of every update order of allUpdateOrders(numAlts), or of
+# allUpdateOrdersFixedTieBreaking(numAlts) if fixedTieBreaking is True. The orders are walked as a tree: the
+# profile after a prefix is computed once for all the orders starting with it, and the changes of each step are
+# undone when backtracking. Orders leading to the same final profile for sure are only visited once: a pair on
+# which no voter is undecided stays so and is a no-op wherever it comes in the rest of the order, and the two
+# orientations of a pair only differ when the majority is tied on it. The exploration stops as soon as visit
+# returns True. The profile given to visit is modified afterwards and should not be kept. If profiler is given,
+# the update steps and the relations they add are counted
+def exploreUpdateOrders(profile, numAlts, visit, fixedTieBreaking = False, profiler = None):
+	prof = [np.array(ballot) for ballot in profile]
+	majority = majority_matrix(prof)
+
+	# Returns True if the exploration has to stop
+	def explore(remainingPairs):
+		remainingPairs = [pair for pair in remainingPairs if any(ballot[pair[0]][pair[1]] == 0 for ballot in prof)]
+		if len(remainingPairs) == 0:
+			return visit(prof, majority)
+		for index, pair in enumerate(remainingPairs):
+			otherPairs = remainingPairs[:index] + remainingPairs[index + 1:]
+			if fixedTieBreaking or majority[pair[0]][pair[1]] != 0:
+				orientedPairs = [pair]
+			else:
+				orientedPairs = [pair, (pair[1], pair[0])]
+			for orientedPair in orientedPairs:
+				changes = update_pair(prof, majority, orientedPair)
+				if profiler is not None:
+					profiler.count("update steps")
+					profiler.count("edges added", len(changes))
+				stop = explore(otherPairs)
+				undo_pair(prof, majority, changes)
+				if stop:
+					return True
+		return False
+
+	explore([tuple(pair) for pair in combinations(range(numAlts), 2)])
+
+# Returns, for each type of manipulation, a boolean array of shape (num_orders, number of criteria) telling for
+# which update orders and criteria it happens, given the consensus before the dynamics (one flag and one winner
+# per criterion) and the consensus after the dynamics for each update order, as returned by all_criteria_batch
+def manipulationOutcomes(beforeFlags, beforeWinners, afterFlags, afterWinners):
+	preserved = beforeFlags & afterFlags
+	sameWinner = preserved & (beforeWinners == afterWinners)
+	return {
+		"consensusPreservation": preserved,
+		"identityPreservation": sameWinner,
+		"identityDestruction": beforeFlags & ~sameWinner,
+		"specificConsensus": afterFlags & ~sameWinner & (afterWinners == 0),
+		"consensusDestruction": beforeFlags & ~afterFlags,
+		"consensusCreation": ~beforeFlags & afterFlags,
+		"noConsensusPreservation": ~beforeFlags & ~afterFlags,
+	}
+
+# Returns, for each type of manipulation, a boolean vector telling for which criteria it can happen given the
+# consensus before the dynamics. The dynamics only add relations to the ballots, so an alternative dominant in
+# a ballot stays so and the unanDominant and majDominant consensus can only be preserved
+def reachableManipulations(beforeFlags, beforeWinners):
+	dominance = np.array([criteria in [unanDominant, majDominant] for criteria in criteriaList()])
+	return {
+		"consensusPreservation": beforeFlags,
+		"identityPreservation": beforeFlags,
+		"identityDestruction": beforeFlags & ~dominance,
+		"specificConsensus": ~beforeFlags | (~dominance & (beforeWinners != 0)),
+		"consensusDestruction": beforeFlags & ~dominance,
+		"consensusCreation": ~beforeFlags,
+		"noConsensusPreservation": ~beforeFlags,
+	}
+
 # The main function for the experiment about manipulation
-def manipulationExperiment(numAgents, numAlts):
+# The final profiles of the update orders are evaluated by batches of batchSize profiles, and the exploration of
+# the update orders stops once all the manipulations that can happen have been observed. Also returns the number
+# of update orders that have actually been evaluated. If profiler is a StageProfiler, the time spent in each stage
+# is recorded, the criteria being evaluated during the exploration
+def manipulationExperiment(numAgents, numAlts, batchSize = 1024, rng = None, profiler = None):
 	res = {(c.__name__, manipulationType): 0 for manipulationType in ["consensusPreservation", "identityPreservation", 
 		"identityDestruction", "specificConsensus", "consensusDestruction", "consensusCreation", 
 		"noConsensusPreservation"] for c in criteriaList()}
 
-	profile = profile_generation(numAgents, numAlts)
-
-	allConsensusBefore = {criteria.__name__: criteria(profile) for criteria in criteriaList()}
-
-	# for updateOrder in allUpdateOrdersFixedTieBreaking(numAlts):
-	for updateOrder in allUpdateOrders(numAlts):
-		finalProfile = update(profile, updateOrder)
-
-		for criteria in criteriaList():
-
-			consensusBefore = allConsensusBefore[criteria.__name__]
-			consensusAfter = criteria(finalProfile)
-
-			if consensusBefore[0] and consensusAfter[0]:
-				res[(criteria.__name__, "consensusPreservation")] = 1
-				if consensusBefore[1] == consensusAfter[1]:
-					res[(criteria.__name__, "identityPreservation")] = 1
-				else:
-					res[(criteria.__name__, "identityDestruction")] = 1
-					if consensusAfter[1] == 0:
-						res[(criteria.__name__, "specificConsensus")] = 1
-			elif consensusBefore[0] and not consensusAfter[0]:
-				res[(criteria.__name__, "consensusDestruction")] = 1
-				res[(criteria.__name__, "identityDestruction")] = 1
-			elif not consensusBefore[0] and consensusAfter[0]:
-				res[(criteria.__name__, "consensusCreation")] = 1
-				if consensusAfter[1] == 0:
-					res[(criteria.__name__, "specificConsensus")] = 1
-			elif not consensusBefore[0] and not consensusAfter[0]:
-				res[(criteria.__name__, "noConsensusPreservation")] = 1
-
-	return (res, {criteria.__name__: allConsensusBefore[criteria.__name__][0] for criteria in criteriaList()})
-
-# The function that is called for the pool of processes for the manipulation experiment
-def manipulationPoolFunction(numAgents):
+	with profiledStage(profiler, "generation"):
+		profile = profile_generation(numAgents, numAlts, rng = rng)
+
+	with profiledStage(profiler, "criteria"):
+		allConsensusBefore = {criteria.__name__: consensus for criteria, consensus in zip(criteriaList(), all_criteria(profile))}
+	beforeFlags = np.array([allConsensusBefore[c.__name__][0] for c in criteriaList()])
+	beforeWinners = np.array([allConsensusBefore[c.__name__][1] if allConsensusBefore[c.__name__][0] else -1 for c in criteriaList()])
+
+	reachable = reachableManipulations(beforeFlags, beforeWinners)
+
+	finalProfiles = np.zeros((batchSize, numAgents, numAlts, numAlts), dtype = np.int8)
+	finalMajorities = np.zeros((batchSize, numAlts, numAlts), dtype = np.int64)
+	numFinalProfiles = 0
+	numEvaluatedOrders = 0
+
+	# Evaluates the criteria on the final profiles stored so far and sets the manipulation flags accordingly.
+	# Returns True if all the manipulations that can happen have been observed
+	def recordOutcomes():
+		nonlocal numFinalProfiles
+		with profiledStage(profiler, "criteria"):
+			(afterFlags, afterWinners) = all_criteria_batch(finalProfiles[:numFinalProfiles], finalMajorities[:numFinalProfiles])
+		allObserved = True
+		for manipulationType, happened in manipulationOutcomes(beforeFlags, beforeWinners, afterFlags, afterWinners).items():
+			for c, criteria in enumerate(criteriaList()):
+				if happened[:, c].any():
+					res[(criteria.__name__, manipulationType)] = 1
+				if reachable[manipulationType][c] and res[(criteria.__name__, manipulationType)] == 0:
+					allObserved = False
+		numFinalProfiles = 0
+		return allObserved
+
+	# Called on the final profile of every update order
+	def storeFinalProfile(finalProfile, finalMajority):
+		nonlocal numFinalProfiles, numEvaluatedOrders
+		finalProfiles[numFinalProfiles] = finalProfile
+		finalMajorities[numFinalProfiles] = finalMajority
+		numFinalProfiles += 1
+		numEvaluatedOrders += 1
+		if numFinalProfiles == batchSize:
+			return recordOutcomes()
+		return False
+
+	with profiledStage(profiler, "exploration"):
+		exploreUpdateOrders(profile, numAlts, storeFinalProfile, profiler = profiler)
+		if numFinalProfiles > 0:
+			recordOutcomes()
+	if profiler is not None:
+		profiler.count("update orders", numEvaluatedOrders)
+
+	return (res, {criteria.__name__: allConsensusBefore[criteria.__name__][0] for criteria in criteriaList()}, numEvaluatedOrders)
+
+# The function that is called for the pool of processes for the manipulation experiment, a work unit being
+# identified by (numAgents, index). The profile of the unit is drawn from its own generator derived from the
+# master seed. Returns the work unit together with the results of manipulationExperiment and the statistics of
+# the worker during the unit (see workerUnitStats)
+def manipulationPoolFunction(unitSeed):
+	startingTime = time.perf_counter()
+	(unit, masterSeed) = unitSeed
 	numAlts = 4
-	return manipulationExperiment(numAgents, numAlts)
-
-# Runs the manipulation experiment with a pool of processes
-def runManipulationExperiment(numAgents, numTryMax):
-	startingTime = time.time()
-	pool = Pool()
-
-	res = {}
+	result = manipulationExperiment(unit[0], numAlts, rng = unitRandomGenerator(masterSeed, unit), profiler = currentProfiler())
+	return (unit, result, workerUnitStats(None, (0, 0), startingTime))
+
+# The list of all the types of manipulation
+def manipulationTypeList():
+	return ["consensusPreservation", "identityPreservation", "identityDestruction", "specificConsensus", "consensusDestruction", 
+		"consensusCreation", "noConsensusPreservation"]
+
+# Merges the results files of the manipulation experiment given in paths, possibly coming from different runs.
+# Returns the number of profiles for which each manipulation happens, the number of profiles with and without
+# initial consensus for each criterion and the number of update orders that have been evaluated, only counting the
+# work units of units if it is not None
+def mergeManipulationShards(paths, units = None):
+	res = {(c.__name__, manipulationType): 0 for manipulationType in manipulationTypeList() for c in criteriaList()}
 	norm = {c.__name__: {"consensusBefore": 0, "notConsensusBefore": 0} for c in criteriaList()}
-
-	i = 0
-	for r in pool.imap_unordered(manipulationPoolFunction, [numAgents for i in range(numTryMax)]):
-		i += 1
-		if i % (numTryMax / 1000) == 0:
-			print(i)
-		for key, frequency in r[0].items():
-			if key in res:
-				res[key] += frequency
-			else:
-				res[key] = frequency
+	numEvaluatedOrders = 0
+	for record in shardRecords(paths, units):
+		# The counts of a record are the sums of the results of manipulationExperiment over its profiles
+		(flags, consensusBefore, numOrders) = record["counts"]
+		for key, frequency in flags.items():
+			res[key] += frequency
+		numEvaluatedOrders += numOrders
 		for criteria in criteriaList():
-			if r[1][criteria.__name__]:
-				norm[criteria.__name__]["consensusBefore"] += 1
-			else:
-				norm[criteria.__name__]["notConsensusBefore"] += 1
-
-	pool.close()
-
-	for criteria in criteriaList():
+			norm[criteria.__name__]["consensusBefore"] += consensusBefore[criteria.__name__]
+			norm[criteria.__name__]["notConsensusBefore"] += len(record["units"]) - consensusBefore[criteria.__name__]
+	return (res, norm, numEvaluatedOrders)
+
+# Returns the DataFrame of the frequency of each manipulation given the merged counts of mergeManipulationShards,
+# for the criteria of norm
+def manipulationDataFrame(res, norm):
+	res = dict(res)
+	for criteria in norm:
 		for manipulationType in ["consensusPreservation", "identityPreservation", "identityDestruction", "consensusDestruction"]:
-			if norm[criteria.__name__]["consensusBefore"] > 0:
-				res[(criteria.__name__, manipulationType)] /= norm[criteria.__name__]["consensusBefore"]
+			if norm[criteria]["consensusBefore"] > 0:
+				res[(criteria, manipulationType)] /= norm[criteria]["consensusBefore"]
 		for manipulationType in ["consensusCreation", "noConsensusPreservation"]:
-			if norm[criteria.__name__]["notConsensusBefore"] > 0:
-				res[(criteria.__name__, manipulationType)] /= norm[criteria.__name__]["notConsensusBefore"]
-		res[(criteria.__name__, "specificConsensus")] /= norm[criteria.__name__]["consensusBefore"] + norm[criteria.__name__]["notConsensusBefore"]
+			if norm[criteria]["notConsensusBefore"] > 0:
+				res[(criteria, manipulationType)] /= norm[criteria]["notConsensusBefore"]
+		if norm[criteria]["consensusBefore"] + norm[criteria]["notConsensusBefore"] > 0:
+			res[(criteria, "specificConsensus")] /= norm[criteria]["consensusBefore"] + norm[criteria]["notConsensusBefore"]
+
+	return pd.DataFrame([{"manipulationType": k[1], "criteria": k[0], "frequency": v} for k, v in res.items()])
+
+# Writes the merged counts of mergeManipulationShards for numAgents agents as the chunk name of the count store path,
+# in the tables "manipulation" (the number of profiles of each criterion and manipulation), "initialConsensus" (the
+# number of profiles with and without initial consensus of each criterion) and "evaluatedOrders"
+def writeManipulationStore(path, name, numAgents, res, norm, numEvaluatedOrders):
+	names = criteriaNames()
+	consensus = ["consensusBefore", "notConsensusBefore"]
+	writeCountChunk(path, "manipulation", name, {
+		"manipulation": ([("criteria", names), ("manipulationType", manipulationTypeList())], 
+			{numAgents: [[res[(criteria, manipulationType)] for manipulationType in manipulationTypeList()] for criteria in names]}),
+		"initialConsensus": ([("criteria", names), ("consensus", consensus)], 
+			{numAgents: [[norm[criteria][c] for c in consensus] for criteria in names]}),
+		"evaluatedOrders": ([], {numAgents: numEvaluatedOrders})})
+
+# Reads the DataFrame of the frequency of each manipulation, as built by manipulationDataFrame, from the count stores
+# of paths. Only the counts of the numbers of agents of numAgentsList and of the criteria of criterias (all of them if
+# None) are read, the frequencies being computed from the counts summed over the stores. The DataFrame has a
+# numAgents column telling which number of agents the frequencies are about
+def loadManipulationData(paths, numAgentsList = None, criterias = None):
+	consensus = ["consensusBefore", "notConsensusBefore"]
+	(counts, _) = readCountTable(paths, "manipulation", "manipulation", numAgentsList, 
+		{"criteria": criteriaNames(criterias), "manipulationType": manipulationTypeList()})
+	(initialConsensus, _) = readCountTable(paths, "manipulation", "initialConsensus", numAgentsList, 
+		{"criteria": criteriaNames(criterias), "consensus": consensus})
+	data = []
+	for numAgents in sorted(counts):
+		res = {(criteria, manipulationType): counts[numAgents][c][t] for t, manipulationType in enumerate(manipulationTypeList()) 
+			for c, criteria in enumerate(criteriaNames(criterias))}
+		norm = {criteria: {k: initialConsensus[numAgents][c][i] for i, k in enumerate(consensus)} for c, criteria in enumerate(criteriaNames(criterias))}
+		data.append(manipulationDataFrame(res, norm).assign(numAgents = numAgents))
+	return pd.concat(data, ignore_index = True) if len(data) > 0 else pd.DataFrame()
+
+# Runs the manipulation experiment for numAgents agents on numTryMax profiles, one work unit per profile, as set by
+# options (see RunOptions). The manipulation experiment does not use the outcome cache
+def runManipulationExperiment(numAgents, numTryMax, options = None):
+	options = (options or RunOptions()).withDefaults(resultsFile = "manipulationCounts_{}.pkl".format(numAgents), 
+		traceFile = "manipulationProfile.json", statusFile = "manipulationStatus.json", storePath = "manipulationStore")
+	if options.cacheSize:
+		raise ValueError("The manipulation experiment does not use the outcome cache")
+	startingTime = time.time()
+
+	requested = {(numAgents, i) for i in range(numTryMax)}
+	(seeds, records, end) = scanRecords(options.resultsFile, requested)
+	masterSeed = runMasterSeed(options.resultsFile, seeds, options.masterSeed)
+	completed = {unit for record in records for unit in record["units"]}
+	units = sorted(requested - completed)
+	print("{} profiles to run, {} already completed.".format(len(units), len(requested & completed)))
+
+	with PoolRun(options, {str(numAgents): len(units)}, masterSeed, end) as run:
+		for (unit, r, unitStats) in run.imap(manipulationPoolFunction, [(unit, masterSeed) for unit in units]):
+			run.add(unit, r, str(numAgents), 1, unitStats)
+
+	(res, norm, numEvaluatedOrders) = mergeManipulationShards([options.resultsFile], requested)
+	numProfiles = norm[criteriaList()[0].__name__]["consensusBefore"] + norm[criteriaList()[0].__name__]["notConsensusBefore"]
+	print("Evaluated {} update orders ({} per profile on average).".format(numEvaluatedOrders, numEvaluatedOrders / max(1, numProfiles)))
 
-	data = pd.DataFrame([{"manipulationType": k[1], "criteria": k[0], "frequency": v} for k, v in res.items()])
-	data.to_pickle("manipulationData.pkl")
+	writeManipulationStore(options.storePath, "run_{}_{}".format(masterSeed, numAgents), numAgents, res, norm, numEvaluatedOrders)
+	data = manipulationDataFrame(res, norm)
 	
 	print("Done in {} seconds.".format(time.time() - startingTime))
 	
-	return data
\ No newline at end of file
+	return data
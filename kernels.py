@@ -0,0 +1,100 @@
+import numpy as np
+
+import os
+import warnings
+
+# Kernels of the majority dynamics working on numpy arrays with explicit loops, compiled with numba when it is
+# installed. The backend is chosen at import time: "numba" if numba can be imported, "python" otherwise, and the
+# MAJ_DYNAMICS_BACKEND environment variable can force "python". Any other value of the variable falls back to
+# "python" with a warning. With the "python" backend the kernels are not used by maj_dynamics and data_generation,
+# which keep their reference implementation, but they can still be run (slowly) to check them against it, see
+# check_kernel_parity in maj_dynamics
+
+KERNEL_BACKENDS = ("numba", "python")
+
+KERNEL_BACKEND = os.environ.get("MAJ_DYNAMICS_BACKEND", "numba").strip().lower()
+
+if KERNEL_BACKEND not in KERNEL_BACKENDS:
+	warnings.warn("Unknown MAJ_DYNAMICS_BACKEND {!r}, expected one of {}: using the python backend.".format(
+		os.environ["MAJ_DYNAMICS_BACKEND"], ", ".join(KERNEL_BACKENDS)))
+	KERNEL_BACKEND = "python"
+
+if KERNEL_BACKEND == "numba":
+	try:
+		import numba
+	except ImportError:
+		KERNEL_BACKEND = "python"
+
+# Decorator compiling a kernel with the selected backend
+def jit(function):
+	if KERNEL_BACKEND == "numba":
+		return numba.njit(cache = True)(function)
+	return function
+
+# Returns True if the kernels are compiled and should be used on numpy arrays
+def kernels_enabled():
+	return KERNEL_BACKEND == "numba"
+
+# The majority dynamics on the profile given as an array of shape (voters, m, m) following the update order given
+# as an array of shape (num_pairs, 2), with the same semantics as update: each undecided voter follows the majority
+# as it was before the step, the relation being closed under transitivity incrementally, and the majority matrix
+# (int64, shape (m, m)) is updated after the step. Both arrays are modified in place
+@jit
+def update_kernel(profile, majority, order):
+	numVoters = profile.shape[0]
+	numAlts = profile.shape[1]
+	above = np.empty(numAlts, dtype = np.int64)
+	below = np.empty(numAlts, dtype = np.int64)
+	delta = np.zeros((numAlts, numAlts), dtype = np.int64)
+	for p in range(order.shape[0]):
+		(a, b) = (order[p, 0], order[p, 1])
+		if majority[a, b] >= 0:
+			(top, bottom) = (a, b)
+		else:
+			(top, bottom) = (b, a)
+		delta[:, :] = 0
+		for x in range(numVoters):
+			if profile[x, a, b] != 0:
+				continue
+			profile[x, top, bottom] = 1
+			profile[x, bottom, top] = -1
+			delta[top, bottom] += 1
+			delta[bottom, top] -= 1
+			numAbove = 0
+			numBelow = 0
+			for k in range(numAlts):
+				if k == top or profile[x, k, top] == 1:
+					above[numAbove] = k
+					numAbove += 1
+				if k == bottom or profile[x, bottom, k] == 1:
+					below[numBelow] = k
+					numBelow += 1
+			for i in range(numAbove):
+				for j in range(numBelow):
+					(k, r) = (above[i], below[j])
+					if profile[x, k, r] < 1:
+						profile[x, k, r] = 1
+						profile[x, r, k] = -1
+						delta[k, r] += 1
+						delta[r, k] -= 1
+		majority += delta
+
+# Returns True if the ballot given as an array of shape (m, m) is transitive
+@jit
+def transitivity_kernel(preference):
+	numAlts = preference.shape[0]
+	for k in range(numAlts):
+		for q in range(numAlts):
+			if preference[k, q] == 1:
+				for r in range(numAlts):
+					if preference[q, r] == 1 and preference[k, r] != 1:
+						return False
+	return True
+
+# Returns True if the alternative is dominant in the ballot given as an array of shape (m, m)
+@jit
+def dominant_kernel(preference, alternative):
+	for i in range(preference.shape[0]):
+		if i != alternative and preference[alternative, i] != 1:
+			return False
+	return True
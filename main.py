@@ -3,19 +3,23 @@ from maj_dynamics import *
 from experiments import *
 from plot import *
 
-# Returns a generator for random profiles
-def randomProfiles(numAgents, numAlts, numProfiles):
-	for i in range(numProfiles):
-		yield profile_generation(numAgents, numAlts)
-
-# Useless function to just get the right number of arguments to plug it in the experiment functions
-def allProfiles(numAgents, numAlts, numProfiles):
-	return getAllProfiles(numAgents, numAlts)
-
 ##### TO CREATE EXPERIMENTS DATA
 
 # dataManipulation = runManipulationExperiment(11, 20000)
-# (dataNumAgents, dataCompleteness) = runFrequencyExperiment(25, 5000000, numAgentsMin = 17)
+# (dataNumAgents, dataCompleteness, dataDisagreement) = runFrequencyExperiment(25, 5000000, numAgentsMin = 17)
+# dataCompleteness = runCompletenessExperiment(15, 100000, binSize = 5)
+# (dataNumAgents, dataCompleteness, dataDisagreement) = runExhaustiveFrequencyExperiment(5, 3)
+
+##### TO MERGE THE RAW COUNTS OF SEVERAL RUNS
+
+# (dataNumAgents, dataCompleteness, dataDisagreement) = frequencyDataFrames(*mergeFrequencyShards(["frequencyCounts.pkl", "otherRun/frequencyCounts.pkl"]))
+# dataManipulation = manipulationDataFrame(*mergeManipulationShards(["manipulationCounts_11.pkl", "otherRun/manipulationCounts_11.pkl"])[:2])
+
+##### TO READ THE RAW COUNTS OF THE COUNT STORES, SUMMING THE RUNS OF ALL THE STORES GIVEN
+
+# dataNumAgents = loadFrequencyNumAgentsData(["frequencyStore"], criterias = [majUndom, plurUndom, condorcet])
+# dataCompleteness = loadFrequencyLevelData(["frequencyStore"], "completeness", numAgentsList = [15])
+# dataManipulation = loadManipulationData(["manipulationStore"], numAgentsList = [11])
 
 ##### READ EXPERIMENT DATA AND GENERATE THE FINAL PLOTS
 
@@ -3,42 +3,231 @@ import numpy as np
 import copy
 import sys
 
-from data_generation import check_transitivity
-from functools import reduce
+from data_generation import check_transitivity, profile_generation_batch, WeightedProfile
+from bit_ballots import *
+from kernels import kernels_enabled, update_kernel, transitivity_kernel, dominant_kernel
 
-# The actual majority dynamics process, update the profile prof given the update order order
-def update(prof, order):
-	majority_pref = reduce(np.add, prof)
+# Closes, in place, the ballot preference under transitivity once the relation x > y has been added to it. Only
+# the consequences of the new relation are propagated: every alternative weakly above x is put above every
+# alternative weakly below y, which takes O(m^2) operations. Returns the list of the pairs (k, r) that have been
+# set to k > r
+def incremental_closure(preference, x, y):
+	alt_number = len(preference)
+	above = [k for k in range(0, alt_number) if k == x or preference[k][x] == 1]
+	below = [r for r in range(0, alt_number) if r == y or preference[y][r] == 1]
+	added = []
+	for k in above:
+		for r in below:
+			if preference[k][r] < 1:
+				preference[k][r] = 1
+				preference[r][k] = -1
+				added.append((k, r))
+	return added
+
+# Closes, in place, the ballot preference under transitivity by looping over all triples of alternatives until
+# nothing changes. This is the original fixpoint computation, kept as a reference for incremental_closure
+def fixpoint_closure(preference, x, y):
+	alt_number = len(preference)
+	added = []
+	done = False
+	while not done:
+		done = True
+		for k in range(0, alt_number):
+			for q in range(0, alt_number):
+				for r in range(0, alt_number):
+					if preference[k][q] == 1 and preference[q][r] == 1 and preference[k][r] < 1:
+						preference[k][r] = 1
+						preference[r][k] = -1
+						added.append((k, r))
+						done = False
+	return added
+
+# Returns the majority matrix of the profile prof, i.e., the sum of its ballots
+def majority_matrix(prof):
+	if isinstance(prof, PackedProfile):
+		return packed_majority_matrix(prof)
+	if isinstance(prof, WeightedProfile):
+		return np.einsum("k,kij->ij", prof.multiplicities, prof.ballots.astype(np.int64))
+	return np.sum(prof, axis = 0, dtype = np.int64)
+
+# Applies, in place, the step of the majority dynamics for the ordered pair of alternatives pair to the profile
+# prof. Each undecided voter follows the majority matrix majority_pref as it was before the step, the matrix is
+# then updated with the +1/-1 changes of every relation set during the step. Assuming the ballots are transitive,
+# only undecided cells get set, so the running majority stays equal to the sum of the ballots. Returns the list
+# of the triples (voter, k, r) such that k > r has been set in the ballot of voter
+def update_pair(prof, majority_pref, pair, closure = incremental_closure):
+	changes = []
+	for x in range(0, len(prof)):
+		if prof[x][pair[0]][pair[1]] == 0:
+			if majority_pref[pair[0]][pair[1]] >= 0:
+				(top, bottom) = (pair[0], pair[1])
+			else:
+				(top, bottom) = (pair[1], pair[0])
+			prof[x][top][bottom] = 1
+			prof[x][bottom][top] = -1
+			changes.append((x, top, bottom))
+			changes.extend((x, k, r) for (k, r) in closure(prof[x], top, bottom))
+	for (x, k, r) in changes:
+		majority_pref[k][r] += 1
+		majority_pref[r][k] -= 1
+	return changes
+
+# Reverts, in place, the changes returned by update_pair on the profile prof and its majority matrix. All the
+# relations set by update_pair were undecided before, so their cells are put back to 0
+def undo_pair(prof, majority_pref, changes):
+	for (x, k, r) in changes:
+		prof[x][k][r] = 0
+		prof[x][r][k] = 0
+		majority_pref[k][r] -= 1
+		majority_pref[r][k] += 1
+
+# The actual majority dynamics process, update the profile prof given the update order order. The closure
+# function is called on a ballot each time a relation x > y is added to it. The majority matrix is kept up to
+# date along the dynamics, if return_majority is True it is returned together with the new profile. Packed
+# profiles are updated with update_packed and weighted profiles with update_weighted. When the kernels are compiled
+# (see kernels), profiles given as numpy arrays are updated with update_kernel, other profiles (lists of ballots)
+# and other closures go through the reference implementation below
+def update(prof, order, closure = incremental_closure, return_majority = False):
+	if isinstance(prof, PackedProfile):
+		return update_packed(prof, order, return_majority)
+	if isinstance(prof, WeightedProfile):
+		return update_weighted(prof, order, return_majority)
+	majority_pref = majority_matrix(prof)
+	if kernels_enabled() and closure is incremental_closure and isinstance(prof, np.ndarray) and prof.ndim == 3:
+		new_prof = prof.copy()
+		update_kernel(new_prof, majority_pref, np.array(order, dtype = np.int64).reshape(-1, 2))
+		if return_majority:
+			return (new_prof, majority_pref)
+		return new_prof
 	new_prof = copy.deepcopy(prof)
-	alt_number = len(prof[0])
-	vot_number = len(prof)
 	for pair in order:  # pair is an ordered pair of alternatives
-		for x in range(0, vot_number):
-			if new_prof[x][pair[0]][pair[1]] == 0:
-				if majority_pref[pair[0]][pair[1]] >= 0:
-					new_prof[x][pair[0]][pair[1]] = 1
-					new_prof[x][pair[1]][pair[0]] = -1
-				else:
-					new_prof[x][pair[0]][pair[1]] = -1
-					new_prof[x][pair[1]][pair[0]] = 1
-				done = False
-				while not done:
-					done = True
-					for k in range(0, alt_number):
-						for q in range(0, alt_number):
-							for r in range(0, alt_number):
-								if new_prof[x][k][q] == 1 and new_prof[x][q][r] == 1 and new_prof[x][k][r] < 1:
-									new_prof[x][k][r] = 1
-									new_prof[x][r][k] = -1
-									done = False
-		majority_pref = reduce(np.add, new_prof)
+		update_pair(new_prof, majority_pref, pair, closure)
+	if return_majority:
+		return (new_prof, majority_pref)
+	return new_prof
+
+# The majority dynamics on a packed profile, see update. The ballots are handled as pairs of words, a relation
+# being added and closed under transitivity with packed_add_relation
+def update_packed(prof, order, return_majority = False):
+	majority_pref = packed_majority_matrix(prof)
+	beats = [int(b) for b in prof.beats]
+	beaten = [int(b) for b in prof.beaten]
+	for pair in order:  # pair is an ordered pair of alternatives
+		bit = relation_bit(pair[0], pair[1])
+		if majority_pref[pair[0]][pair[1]] >= 0:
+			(top, bottom) = (pair[0], pair[1])
+		else:
+			(top, bottom) = (pair[1], pair[0])
+		changes = []
+		for x in range(0, len(beats)):
+			if not (beats[x] | beaten[x]) & bit:
+				(new_beats, beaten[x]) = packed_add_relation(beats[x], beaten[x], top, bottom)
+				added = new_beats & ~beats[x]
+				beats[x] = new_beats
+				while added:
+					position = (added & -added).bit_length() - 1
+					changes.append(divmod(position, MAX_PACKED_ALTS))
+					added &= added - 1
+		for (k, r) in changes:
+			majority_pref[k][r] += 1
+			majority_pref[r][k] -= 1
+	new_prof = PackedProfile(beats, beaten, prof.numAlts)
+	if return_majority:
+		return (new_prof, majority_pref)
+	return new_prof
+
+# Closes, in place, a batch of ballots given as an array of shape (num_ballots, m, m) once the relation
+# x[b] > y[b] has been added to the ballot b. As for incremental_closure, every alternative weakly above x[b] is
+# put above every alternative weakly below y[b]
+def incremental_closure_batch(ballots, x, y):
+	indices = np.arange(len(ballots))
+	above = ballots[indices, :, x] == 1
+	above[indices, x] = True
+	below = ballots[indices, y, :] == 1
+	below[indices, y] = True
+	added = above[:, :, None] & below[:, None, :] & (ballots != 1)
+	ballots[added] = 1
+	ballots[added.transpose(0, 2, 1)] = -1
+	return ballots
+
+# Computes, in place, the transitive closure of a batch of ballots given as an array of shape (num_ballots, m, m),
+# every new relation k > r being written as a 1 in [k][r] and a -1 in [r][k]. The whole closure is recomputed
+# with a Warshall pass, the arguments x and y are only there to match incremental_closure_batch
+def transitive_closure_batch(ballots, x = None, y = None):
+	alt_number = ballots.shape[-1]
+	beats = ballots == 1
+	for q in range(0, alt_number):
+		beats |= beats[:, :, q, None] & beats[:, None, q, :]
+	added = beats & (ballots != 1)
+	ballots[added] = 1
+	ballots[added.transpose(0, 2, 1)] = -1
+	return ballots
+
+# The majority dynamics on a WeightedProfile, see update. The new ballot of a voter only depends on their ballot
+# and on the majority matrix, so all the voters with the same ballot stay identical and each distinct ballot is
+# updated once, the majority matrix being weighted by the multiplicities. The cost does not depend on the number
+# of voters. Distinct ballots can become identical along the dynamics, they are not merged
+def update_weighted(prof, order, return_majority = False):
+	ballots = np.array(prof.ballots, dtype = np.int8)
+	multiplicities = prof.multiplicities
+	majority_pref = majority_matrix(prof)
+	for pair in order:  # pair is an ordered pair of alternatives
+		undecided = ballots[:, pair[0], pair[1]] == 0
+		if not undecided.any():
+			continue
+		if majority_pref[pair[0]][pair[1]] >= 0:
+			(top, bottom) = (pair[0], pair[1])
+		else:
+			(top, bottom) = (pair[1], pair[0])
+		changed = ballots[undecided]
+		previous = changed.copy()
+		changed[:, top, bottom] = 1
+		changed[:, bottom, top] = -1
+		incremental_closure_batch(changed, np.full(len(changed), top), np.full(len(changed), bottom))
+		ballots[undecided] = changed
+		majority_pref += np.einsum("k,kij->ij", multiplicities[undecided], changed.astype(np.int64) - previous)
+	new_prof = WeightedProfile(ballots, multiplicities)
+	if return_majority:
+		return (new_prof, majority_pref)
 	return new_prof
 
+# Batched version of the majority dynamics: profiles is an array of shape (num_profiles, voters, m, m) and
+# every profile is updated following the same update order. The result is identical to calling update on
+# each profile separately. The majority matrices, of shape (num_profiles, m, m), are kept up to date with the
+# changes made to the ballots and returned as well if return_majority is True. If profiler is given (a
+# StageProfiler), the closure passes, the ballots they update and the relations they add are counted
+def update_batch(profiles, order, closure = incremental_closure_batch, return_majority = False, profiler = None):
+	new_profiles = np.array(profiles, dtype = np.int8)
+	majority_pref = new_profiles.sum(axis = 1, dtype = np.int64)
+	profile_indices = np.broadcast_to(np.arange(len(new_profiles))[:, None], new_profiles.shape[:2])
+	for pair in order:
+		undecided = new_profiles[:, :, pair[0], pair[1]] == 0
+		if not undecided.any():
+			continue
+		values = np.where(majority_pref[:, pair[0], pair[1]] >= 0, 1, -1).astype(np.int8)
+		values = np.broadcast_to(values[:, None], undecided.shape)[undecided]
+		ballots = new_profiles[undecided]
+		previous_ballots = ballots.copy()
+		ballots[:, pair[0], pair[1]] = values
+		ballots[:, pair[1], pair[0]] = -values
+		top = np.where(values == 1, pair[0], pair[1])
+		bottom = np.where(values == 1, pair[1], pair[0])
+		new_profiles[undecided] = closure(ballots, top, bottom)
+		if profiler is not None:
+			profiler.count("closure passes")
+			profiler.count("ballots updated", len(ballots))
+			profiler.count("edges added", np.count_nonzero(ballots == 1) - np.count_nonzero(previous_ballots == 1))
+		np.add.at(majority_pref, profile_indices[undecided], ballots.astype(np.int64) - previous_ballots)
+	if return_majority:
+		return (new_profiles, majority_pref)
+	return new_profiles
+
 # Returns a tuple (Boolean, Winner) with Boolean indicating whether a Condorcet winner exists in the 
-# profile prof and Winner the actual Condorcet winner (or None if none exists)
-def condorcet(prof):
+# profile prof and Winner the actual Condorcet winner (or None if none exists). The majority matrix of the
+# profile can be given if it is already known
+def condorcet(prof, majority_pref = None):
 	alt_number = len(prof[0])
-	gen_majority_pref = reduce(np.add, prof)
+	gen_majority_pref = majority_matrix(prof) if majority_pref is None else majority_pref
 	for i in range(0, alt_number):
 		condorcet_winner = True
 		for j in range(0, alt_number):
@@ -54,6 +243,8 @@ def condorcet(prof):
 # is beaten by at least one other, and a 1 indicates that it is never beaten
 def individual_one_approval_scores(preference):
 	alt_number = len(preference)
+	if isinstance(preference, PackedBallot):
+		return [1 if packed_is_undominated(preference, i) else 0 for i in range(0, alt_number)]
 	scores = []
 	for i in range(0, alt_number):
 		score = 1
@@ -67,6 +258,8 @@ def individual_one_approval_scores(preference):
 # Returns a score vector for a profile in which the number at an alternative position indicates the number
 # of ballot in which the alternative is never beaten
 def total_one_approval_scores(profile): 
+	if isinstance(profile, WeightedProfile):
+		return [int(score) for score in criteria_statistics(profile)[2]]
 	scores = []
 	for i in range(0, len(profile[0])):
 		score = 0
@@ -107,6 +300,10 @@ def one_approval_maj(profile):
 
 # Returns True if the alternative is dominant in the ballot preference
 def is_dominant(preference, alternative):
+	if isinstance(preference, PackedBallot):
+		return packed_is_dominant(preference, alternative)
+	if kernels_enabled() and isinstance(preference, np.ndarray):
+		return dominant_kernel(preference, alternative)
 	for i in range(0, len(preference)):
 		if i != alternative:
 			if preference[alternative][i] != 1:
@@ -116,6 +313,8 @@ def is_dominant(preference, alternative):
 # Returns a tuple (Boolean, Winner) with Boolean indicating whether a UnanDominant winner exists in the 
 # profile prof and Winner the actual UnanDominant winner (or None if none exists)
 def unanDominant(profile):
+	if isinstance(profile, WeightedProfile):
+		return all_criteria(profile)[1]
 	for i in range(0, len(profile[0])):
 		this_is_dominant = True
 		for n in range(0, len(profile)):
@@ -128,6 +327,8 @@ def unanDominant(profile):
 # Returns a tuple (Boolean, Winner) with Boolean indicating whether a MajDominant winner exists in the 
 # profile prof and Winner the actual MajDominant winner (or None if none exists)
 def majDominant(profile):
+	if isinstance(profile, WeightedProfile):
+		return all_criteria(profile)[2]
 	alt_number = len(profile[0])
 	vot_number = len(profile)
 	for i in range(0, alt_number):
@@ -142,6 +343,8 @@ def majDominant(profile):
 # Returns a tuple (Boolean, Winner) with Boolean indicating whether a unique PlurDominant winner exists in the 
 # profile prof and Winner the actual unique PlurDominant winner (or None if none exists)
 def plurDominant(profile):
+	if isinstance(profile, WeightedProfile):
+		return all_criteria(profile)[3]
 	alt_number = len(profile[0])
 	dominances = []
 	for i in range(alt_number):
@@ -181,4 +384,116 @@ def majUndom(profile):
 	majWinners = one_approval_maj(profile)
 	if len(majWinners) == 1:
 		return (True, majWinners[0])
-	return (False, None)
\ No newline at end of file
+	return (False, None)
+
+# Names of the criteria, in the order in which all_criteria and all_criteria_batch return their results
+def criteria_names():
+	return ["condorcet", "unanDominant", "majDominant", "plurDominant", "plurUndom", "unanUndom", "majUndom"]
+
+# Returns the quantities all the criteria are computed from: the majority matrix (the one given if not None),
+# the number of ballots in which each alternative is dominant, the number of ballots in which each alternative
+# is undominated and the number of voters. For a WeightedProfile the ballots are counted with their multiplicity
+def criteria_statistics(profile, majority_pref = None):
+	if isinstance(profile, WeightedProfile):
+		(ballots, multiplicities) = (profile.ballots, profile.multiplicities)
+	else:
+		if isinstance(profile, PackedProfile):
+			profile = unpack_profile(profile)
+		ballots = np.asarray(profile)
+		multiplicities = np.ones(len(ballots), dtype = np.int64)
+	alt_number = ballots.shape[-1]
+	if majority_pref is None:
+		majority_pref = np.einsum("k,kij->ij", multiplicities, ballots.astype(np.int64))
+	dominant_counts = multiplicities @ ((ballots == 1).sum(axis = -1) == alt_number - 1)
+	undominated_counts = multiplicities @ ~(ballots == -1).any(axis = -1)
+	return (majority_pref, dominant_counts, undominated_counts, int(multiplicities.sum()))
+
+# Returns the unique alternative satisfying winners (a boolean vector) or None
+def unique_winner(winners):
+	indices = np.flatnonzero(winners)
+	if len(indices) == 1:
+		return int(indices[0])
+	return None
+
+# Returns the list of the tuples (Boolean, Winner) of all the criteria, in the order of criteria_names, computing
+# the shared quantities only once. The results are the same as the ones of the individual criteria functions
+def all_criteria(profile, majority_pref = None):
+	(majority_pref, dominant_counts, undominated_counts, vot_number) = criteria_statistics(profile, majority_pref)
+	alt_number = len(dominant_counts)
+	results = []
+
+	beats_all = (np.asarray(majority_pref) > 0) | np.eye(alt_number, dtype = bool)
+	condorcet_winners = np.flatnonzero(beats_all.all(axis = 1))
+	results.append((True, int(condorcet_winners[0])) if len(condorcet_winners) > 0 else (False, None))
+
+	for dominant in [dominant_counts == vot_number, 2 * dominant_counts > vot_number]:
+		dominant = np.flatnonzero(dominant)
+		results.append((True, int(dominant[0])) if len(dominant) > 0 else (False, None))
+
+	winning_score = np.max(dominant_counts)
+	plurality_winners = [int(i) for i in np.flatnonzero(dominant_counts == winning_score)] if winning_score != 0 else []
+	results.append((True, plurality_winners[0]) if len(plurality_winners) == 1 else (False, plurality_winners))
+
+	for undominated in [undominated_counts == np.max(undominated_counts), undominated_counts == vot_number,
+			2 * undominated_counts > vot_number]:
+		winner = unique_winner(undominated)
+		results.append((winner is not None, winner))
+
+	return results
+
+# Batched version of all_criteria for an array of profiles of shape (num_profiles, voters, m, m), the majority
+# matrices of shape (num_profiles, m, m) can be given if they are already known. Returns two arrays of shape
+# (num_profiles, number of criteria): whether each criterion has a winner and the winner, which is -1 when the
+# criterion has none (including when plurDominant has several winners)
+def all_criteria_batch(profiles, majority_pref = None):
+	profiles = np.asarray(profiles)
+	(profile_number, vot_number, alt_number) = profiles.shape[:3]
+	if majority_pref is None:
+		majority_pref = profiles.sum(axis = 1, dtype = np.int64)
+	dominant_counts = ((profiles == 1).sum(axis = -1) == alt_number - 1).sum(axis = 1)
+	undominated_counts = (~(profiles == -1).any(axis = -1)).sum(axis = 1)
+
+	first_winners = [
+		((majority_pref > 0) | np.eye(alt_number, dtype = bool)).all(axis = -1),
+		dominant_counts == vot_number,
+		2 * dominant_counts > vot_number,
+	]
+	max_dominant = dominant_counts.max(axis = 1, keepdims = True)
+	unique_winners = [
+		(dominant_counts == max_dominant) & (max_dominant != 0),
+		undominated_counts == undominated_counts.max(axis = 1, keepdims = True),
+		undominated_counts == vot_number,
+		2 * undominated_counts > vot_number,
+	]
+
+	flags = np.zeros((profile_number, len(criteria_names())), dtype = bool)
+	winners = np.full((profile_number, len(criteria_names())), -1, dtype = np.int64)
+	for c, candidates in enumerate(first_winners):
+		flags[:, c] = candidates.any(axis = 1)
+		winners[:, c] = np.where(flags[:, c], np.argmax(candidates, axis = 1), -1)
+	for c, candidates in enumerate(unique_winners, start = len(first_winners)):
+		flags[:, c] = candidates.sum(axis = 1) == 1
+		winners[:, c] = np.where(flags[:, c], np.argmax(candidates, axis = 1), -1)
+	return (flags, winners)
+
+# Checks that the kernels (compiled or not, see kernels) give the same results as the reference implementation on
+# numProfiles random profiles of numAgents voters over numAlts alternatives and on all the update orders of the
+# pairs in increasing order and its reverse. Raises an AssertionError at the first difference, returns the number
+# of profiles checked otherwise
+def check_kernel_parity(numProfiles = 200, numAgents = 5, numAlts = 4, seed = 0):
+	rng = np.random.default_rng(seed)
+	pairs = [(i, j) for i in range(numAlts) for j in range(i + 1, numAlts)]
+	orders = [pairs, [(j, i) for (i, j) in reversed(pairs)]]
+	for profile in profile_generation_batch(numProfiles, numAgents, numAlts, rng):
+		for order in orders:
+			(reference, referenceMajority) = update(profile.tolist(), order, return_majority = True)
+			compiled = profile.copy()
+			compiledMajority = majority_matrix(profile)
+			update_kernel(compiled, compiledMajority, np.array(order, dtype = np.int64))
+			assert np.array_equal(np.array(reference), compiled), "update_kernel differs on {}".format(profile.tolist())
+			assert np.array_equal(referenceMajority, compiledMajority), "update_kernel majority differs on {}".format(profile.tolist())
+		for ballot in list(profile) + list(rng.integers(-1, 2, (numAgents, numAlts, numAlts))):
+			assert transitivity_kernel(ballot) == check_transitivity(ballot.tolist()), "transitivity_kernel differs on {}".format(ballot.tolist())
+			for alternative in range(numAlts):
+				assert dominant_kernel(ballot, alternative) == is_dominant(ballot.tolist(), alternative), "dominant_kernel differs on {}".format(ballot.tolist())
+	return numProfiles
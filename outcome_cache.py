@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+import threading
+
+# Cache of the outcomes of the dynamics, keyed by a canonical fingerprint of the profiles. The dynamics and all
+# the criteria are anonymous, so two profiles with the same ballots up to the order of the voters have the same
+# outcome and the sorted catalogue indices of the ballots of a profile are used as key
+
+# At most maxSize outcomes shared by the workers of a pool, living in the process of a SharedOutcomeManager and
+# evicted in least recently used order as in OutcomeCache. The outcomes are looked for and added by batches, as every
+# call is a round trip to the manager. The manager serves every worker from its own thread, hence the lock
+class SharedOutcomes:
+	def __init__(self, maxSize):
+		self.maxSize = maxSize
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	# Returns the outcomes of keys, None for the ones that are not stored
+	def getMany(self, keys):
+		with self.lock:
+			outcomes = [self.entries.get(key) for key in keys]
+			for key, outcome in zip(keys, outcomes):
+				if outcome is not None:
+					self.entries.move_to_end(key)
+		return outcomes
+
+	# Stores the pairs (key, outcome) of items, evicting the least recently used outcomes beyond maxSize
+	def putMany(self, items):
+		with self.lock:
+			for key, outcome in items:
+				self.entries[key] = outcome
+				self.entries.move_to_end(key)
+			while len(self.entries) > self.maxSize:
+				self.entries.popitem(last = False)
+
+# Manager serving the SharedOutcomes of a pool
+class SharedOutcomeManager(BaseManager):
+	pass
+
+SharedOutcomeManager.register("SharedOutcomes", SharedOutcomes)
+
+# A least recently used cache of at most maxSize outcomes, counting its hits and misses. If shared is given (a proxy
+# of SharedOutcomes), the outcomes missing locally are looked for in shared and the new ones are added to it, so that
+# the workers of a pool share their results. Use getMany and putMany on whole chunks of profiles: with shared, each
+# call costs a round trip to the manager
+class OutcomeCache:
+	def __init__(self, maxSize, shared = None):
+		self.maxSize = maxSize
+		self.shared = shared
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	# Returns the outcome stored for key, or None if there is none
+	def get(self, key):
+		return self.getMany([key])[0]
+
+	# Returns the outcomes stored for keys, None for the ones that are not stored. The outcomes missing locally are
+	# looked for in the shared outcomes all at once
+	def getMany(self, keys):
+		outcomes = [self.entries.get(key) for key in keys]
+		if self.shared is not None:
+			missing = list(dict.fromkeys(key for key, outcome in zip(keys, outcomes) if outcome is None))
+			if len(missing) > 0:
+				found = {key: outcome for key, outcome in zip(missing, self.shared.getMany(missing)) if outcome is not None}
+				for key, outcome in found.items():
+					self.store(key, outcome)
+				outcomes = [found.get(key) if outcome is None else outcome for key, outcome in zip(keys, outcomes)]
+		for key, outcome in zip(keys, outcomes):
+			if outcome is None:
+				self.misses += 1
+			else:
+				if key in self.entries:
+					self.entries.move_to_end(key)
+				self.hits += 1
+		return outcomes
+
+	# Stores the outcome of key, locally and in the shared outcomes
+	def put(self, key, outcome):
+		self.putMany([(key, outcome)])
+
+	# Stores the pairs (key, outcome) of items, locally and in the shared outcomes all at once
+	def putMany(self, items):
+		for key, outcome in items:
+			self.store(key, outcome)
+		if self.shared is not None and len(items) > 0:
+			self.shared.putMany(items)
+
+	# Stores the outcome of key locally, evicting the least recently used outcome if the cache is full
+	def store(self, key, outcome):
+		self.entries[key] = outcome
+		self.entries.move_to_end(key)
+		if len(self.entries) > self.maxSize:
+			self.entries.popitem(last = False)
+
+	# Returns the numbers of hits and misses so far
+	def stats(self):
+		return (self.hits, self.misses)
+
+# The cache of the current worker process, set by initWorkerOutcomeCache
+workerOutcomeCache = None
+
+# Initializer of the pool workers creating their outcome cache, None meaning no cache
+def initWorkerOutcomeCache(maxSize, shared = None):
+	global workerOutcomeCache
+	workerOutcomeCache = OutcomeCache(maxSize, shared) if maxSize else None
+
+# Returns the cache of the current worker process
+def currentOutcomeCache():
+	return workerOutcomeCache
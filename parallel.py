@@ -0,0 +1,50 @@
+import numpy as np
+
+import os
+import time
+
+from collections import deque
+
+# Helpers to run the work units of the experiments on a pool of processes. Each work unit draws its profiles
+# from its own random generator, derived from the master seed of the run and the unit identifier, so the results
+# of a unit do not depend on the worker that runs it nor on the order in which the units are run
+
+# Returns a new master seed, to be used when the run does not specify one
+def newMasterSeed():
+	return np.random.SeedSequence().entropy
+
+# Returns the random generator of the work unit (a tuple of non-negative integers) for the master seed
+def unitRandomGenerator(masterSeed, unit):
+	return np.random.default_rng(np.random.SeedSequence(masterSeed, spawn_key = tuple(unit)))
+
+# Runs function on all the items of a task in a worker. Returns the results together with the time it took
+def runTask(functionItems):
+	(function, items) = functionItems
+	startingTime = time.monotonic()
+	results = [function(item) for item in items]
+	return (results, time.monotonic() - startingTime)
+
+# Applies function to all the items with the pool of processes and yields the results as they come. Items are
+# sent to the workers by tasks of several items whose size adapts to the measured duration of the previous tasks,
+# so that a task takes about targetSeconds: cheap items are batched to amortise the communication with the
+# workers, and expensive ones are sent alone. A task never takes more than a fair share of the remaining items so
+# that the workers finish together. At most 2 tasks per worker are waiting at any time
+def adaptiveImap(pool, function, items, numWorkers = None, targetSeconds = 2):
+	items = list(items)
+	numWorkers = numWorkers or os.cpu_count() or 1
+	taskSize = 1
+	secondsPerItem = None
+	pending = deque()
+	start = 0
+	while start < len(items) or len(pending) > 0:
+		while start < len(items) and len(pending) < 2 * numWorkers:
+			size = max(1, min(taskSize, (len(items) - start) // (2 * numWorkers)))
+			pending.append(pool.apply_async(runTask, ((function, items[start:start + size]),)))
+			start += size
+		(results, elapsed) = pending.popleft().get()
+		# Exponential moving average of the time per item
+		measured = elapsed / len(results)
+		secondsPerItem = measured if secondsPerItem is None else 0.7 * secondsPerItem + 0.3 * measured
+		taskSize = max(1, int(targetSeconds / max(secondsPerItem, 1e-6)))
+		for result in results:
+			yield result
@@ -5,6 +5,11 @@ import numpy as np
 
 import matplotlib
 
+import hashlib
+import os
+
+from multiprocessing import Pool
+
 from maj_dynamics import *
 
 # Renaming the criteria
@@ -56,6 +61,8 @@ def frequencyNumAgentsPlot(data, numAlts, criteria = None, criterias = None, fil
 	data["effect"] = data["effect"].map(effectName)
 	data["frequency"] *= 100
 
+	palette = ['#a1c9f4', '#ffb482', '#8de5a1', '#fab0e4', '#debb9b', '#d0bbff', '#ff9f9b', '#cfcfcf', '#fffea3', '#b9f2f0']
+
 	g = sns.catplot(
 		data = data,
 		kind = "point",
@@ -68,8 +75,7 @@ def frequencyNumAgentsPlot(data, numAlts, criteria = None, criterias = None, fil
 		col_wrap = 4 if len(criterias) > 1 else None,
 		col_order = [criteriaName(c) for c in ["unanDominant", "majDominant", "plurDominant", "condorcet",
 			"unanUndom", "majUndom", "plurUndom"] if c in criterias] if len(criterias) > 1 else None,
-		palette = ['#a1c9f4', '#ffb482', '#8de5a1', '#fab0e4', '#debb9b', '#d0bbff', '#ff9f9b', 
-			'#cfcfcf', '#fffea3', '#b9f2f0'],
+		palette = palette,
 		legend = False,
 		height = 3.5,
 	)
@@ -80,6 +86,18 @@ def frequencyNumAgentsPlot(data, numAlts, criteria = None, criterias = None, fil
 	for ax in g.axes.flatten():
 		ax.tick_params(labelbottom = True)
 
+	# Error bars from the confidence intervals of the frequencies, when the data has them
+	if "lower" in data.columns:
+		data["lower"] *= 100
+		data["upper"] *= 100
+		numAgentsOrder = sorted(data["numAgents"].unique())
+		effectOrder = list(data["effect"].unique())
+		axes = g.axes_dict if len(criterias) > 1 else {criteriaName(criterias[0]): g.ax}
+		for criteria, ax in axes.items():
+			for effect, effectData in data[data["criteria"] == criteria].groupby("effect"):
+				ax.vlines([numAgentsOrder.index(n) for n in effectData["numAgents"]], effectData["lower"], effectData["upper"], 
+					color = palette[effectOrder.index(effect)], linewidth = 1)
+
 	plt.legend(bbox_to_anchor = (1.95, 0.75), title = "Effect on Consensus")
 	# plt.legend(bbox_to_anchor = (1.02, 0.75), title = "Effect on Consensus")
 	
@@ -88,21 +106,59 @@ def frequencyNumAgentsPlot(data, numAlts, criteria = None, criterias = None, fil
 	else:
 		plt.show()
 
+# Draws the plot of a task (plotFunction, args, kwargs) of renderPlots
+def renderPlot(task):
+	(plotFunction, args, kwargs) = task
+	plotFunction(*args, **kwargs)
+
+# Draws the plots of the tasks (plotFunction, args, kwargs), each one saving its figure to the fileName of kwargs, in
+# parallel with numWorkers processes (by default the number of CPUs)
+def renderPlots(tasks, numWorkers = None):
+	with Pool(numWorkers, initializer = matplotlib.use, initargs = ("Agg",)) as pool:
+		pool.map(renderPlot, tasks, chunksize = 1)
+
 # Generates all the plots based on the number of agents for all criteria
-def generateFrequencyNumAgentsPlots(data, numAlts):
-	frequencyNumAgentsPlot(data, numAlts, fileName = "Plots/frequencyNumAgentsAll.pdf")
+def generateFrequencyNumAgentsPlots(data, numAlts, numWorkers = None):
+	tasks = [(frequencyNumAgentsPlot, (data, numAlts), {"fileName": "Plots/frequencyNumAgentsAll.pdf"})]
 	for criteria in [condorcet, unanDominant, majDominant, plurDominant, plurUndom, unanUndom, majUndom]:
-		frequencyNumAgentsPlot(data, numAlts, criteria = criteria, fileName = "Plots/frequencyNumAgents" + criteria.__name__ + ".pdf")
+		tasks.append((frequencyNumAgentsPlot, (data, numAlts), {"criteria": criteria, "fileName": "Plots/frequencyNumAgents" + criteria.__name__ + ".pdf"}))
+	renderPlots(tasks, numWorkers)
+
+# Returns the frequency of each effect by category of binSize percents of completeness, given the raw counts of data
+# by completeness level: the counts of the levels of a category are summed and normalised among the profiles with
+# (Ok, Terrible) and without (Good, Bad) initial consensus. The result is cached in cacheDirectory (unless it is
+# None), keyed by the hash of data and binSize
+def completenessCategories(data, binSize = 5, cacheDirectory = "plotCache"):
+	if cacheDirectory != None:
+		key = hashlib.sha1(pd.util.hash_pandas_object(data, index = False).values.tobytes())
+		key.update(repr(binSize).encode())
+		cacheFile = os.path.join(cacheDirectory, "completeness_{}.pkl".format(key.hexdigest()))
+		if os.path.exists(cacheFile):
+			return pd.read_pickle(cacheFile)
+
+	data = data.assign(completeness = (np.round((100 * data["completeness"]) / binSize) * binSize).astype(np.int64))
+	categories = data.groupby(["numAgents", "completeness", "criteria", "effect"], as_index = False, sort = False)["frequency"].sum()
+	initConsensus = categories["effect"].isin(["Ok", "Terrible"]).rename("initConsensus")
+	norm = categories.groupby([categories["numAgents"], categories["completeness"], categories["criteria"], initConsensus])["frequency"].transform("sum")
+	categories["frequency"] = np.where(norm > 0, categories["frequency"] / norm.where(norm > 0, 1), categories["frequency"])
+
+	if cacheDirectory != None:
+		os.makedirs(cacheDirectory, exist_ok = True)
+		temporaryFile = "{}.{}.tmp".format(cacheFile, os.getpid())
+		categories.to_pickle(temporaryFile)
+		os.replace(temporaryFile, cacheFile)
+	return categories
 
 # Plots the frequency of each effect based on the completeness level of the profile
-def frequencyCompletenessPlot(data, numAgents, numAlts, criteria = None, criterias = None, fileName = None, binSize = 5):
+def frequencyCompletenessPlot(data, numAgents, numAlts, criteria = None, criterias = None, fileName = None, binSize = 5, 
+	cacheDirectory = "plotCache"):
 	plt.close('all')
 
 	sns.set_theme()
 
-	data = data.copy(deep = True)
+	data = completenessCategories(data, binSize, cacheDirectory)
 
-	data = data[data["numAgents"] == numAgents]
+	data = data[data["numAgents"] == numAgents].copy()
 
 	if criteria != None:
 		criterias = [criteria.__name__]
@@ -116,39 +172,6 @@ def frequencyCompletenessPlot(data, numAgents, numAlts, criteria = None, criteri
 	data["criteria"] = data["criteria"].map(criteriaName)
 	data["effect"] = data["effect"].map(effectName)
 
-	# Making categories
-	newData = {}
-	norm = {}
-	for line in data.iterrows():
-		line = line[1]
-		completenessCat = round((100 * line["completeness"]) / binSize) * binSize
-		effect = line["effect"]
-		crit = line["criteria"]
-		if (completenessCat, crit, effect) in newData:
-			newData[(completenessCat, crit, effect)]["frequency"] += line["frequency"]
-		else:
-			newData[(completenessCat, crit, effect)] = {"frequency": line["frequency"], "completeness": completenessCat, "effect": effect, "criteria": crit}
-		if effect in ["Generating Consensus", "Preserving Absence of Cons."]:
-			if (completenessCat, crit, "noInitConsensus") in norm:	
-				norm[(completenessCat, crit, "noInitConsensus")] += line["frequency"]
-			else:
-				norm[(completenessCat, crit, "noInitConsensus")] = line["frequency"]
-		else:
-			if (completenessCat, crit, "initConsensus") in norm:	
-				norm[(completenessCat, crit, "initConsensus")] += line["frequency"]
-			else:
-				norm[(completenessCat, crit, "initConsensus")] = line["frequency"]
-
-	for key, value in newData.items():
-		if key[2] in ["Generating Consensus", "Preserving Absence of Cons."]:
-			if norm[(key[0], key[1], "noInitConsensus")] > 0:
-				value["frequency"] /= norm[(key[0], key[1], "noInitConsensus")]
-		else:
-			if norm[(key[0], key[1], "initConsensus")] > 0:
-				value["frequency"] /= norm[(key[0], key[1], "initConsensus")]
-
-	data = pd.DataFrame([d for _, d in newData.items()])
-
 	data["frequency"] *= 100
 
 	g = sns.catplot(
@@ -190,11 +213,15 @@ def frequencyCompletenessPlot(data, numAgents, numAlts, criteria = None, criteri
 	else:
 		plt.show()
 
-# Generates all the plots based on completeness level for all criteria
-def generateFrequencyCompletenessPlots(data, numAgents, numAlts):
-	frequencyCompletenessPlot(data, numAgents, numAlts, fileName = "Plots/frequencyCompletenessAll.pdf")
+# Generates all the plots based on completeness level for all criteria. The categories are computed once and passed
+# to the workers, which then find them in the cache
+def generateFrequencyCompletenessPlots(data, numAgents, numAlts, numWorkers = None, cacheDirectory = "plotCache"):
+	completenessCategories(data, 5, cacheDirectory)
+	tasks = [(frequencyCompletenessPlot, (data, numAgents, numAlts), {"fileName": "Plots/frequencyCompletenessAll.pdf", "cacheDirectory": cacheDirectory})]
 	for criteria in [condorcet, unanDominant, majDominant, plurDominant, plurUndom, majUndom, unanUndom]:
-		frequencyCompletenessPlot(data, numAgents, numAlts, criteria = criteria, fileName = "Plots/frequencyCompleteness" + criteria.__name__ + ".pdf")
+		tasks.append((frequencyCompletenessPlot, (data, numAgents, numAlts), {"criteria": criteria, 
+			"fileName": "Plots/frequencyCompleteness" + criteria.__name__ + ".pdf", "cacheDirectory": cacheDirectory}))
+	renderPlots(tasks, numWorkers)
 
 # Renaming the manipulation effect
 def manipulationName(manipulationType):
@@ -266,7 +293,8 @@ def manipulationPlot(data, criteria = None, criterias = None, fileName = None):
 		plt.show()
 
 # Generates all the manipulation plots
-def generateManipulationPlots(data):
-	manipulationPlot(data, fileName = "Plots/manipulationAll.pdf")
+def generateManipulationPlots(data, numWorkers = None):
+	tasks = [(manipulationPlot, (data,), {"fileName": "Plots/manipulationAll.pdf"})]
 	for criteria in [condorcet, unanDominant, majDominant, plurDominant, plurUndom, majUndom, unanUndom]:
-		manipulationPlot(data, criteria = criteria, fileName = "Plots/manipulation" + criteria.__name__ + ".pdf")
\ No newline at end of file
+		tasks.append((manipulationPlot, (data,), {"criteria": criteria, "fileName": "Plots/manipulation" + criteria.__name__ + ".pdf"}))
+	renderPlots(tasks, numWorkers)
\ No newline at end of file
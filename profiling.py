@@ -0,0 +1,87 @@
+import json
+import time
+
+from contextlib import contextmanager, nullcontext
+
+# Opt-in instrumentation of the experiments: a StageProfiler records, for every stage of the computation, the
+# number of calls and the time spent, together with counters (update steps, edges added by the closure, ...). The
+# workers of a pool send snapshots of their profiler to the parent, which aggregates them
+
+# Records the calls, time and counters of the stages of a computation
+class StageProfiler:
+	def __init__(self):
+		self.stages = {}
+		self.counters = {}
+
+	# Context manager timing a call of the stage name
+	@contextmanager
+	def stage(self, name):
+		startingTime = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.record(name, time.perf_counter() - startingTime)
+
+	# Records calls calls of the stage name that took seconds seconds in total
+	def record(self, name, seconds, calls = 1):
+		(previousCalls, previousSeconds) = self.stages.get(name, (0, 0.0))
+		self.stages[name] = (previousCalls + calls, previousSeconds + seconds)
+
+	# Adds value to the counter name
+	def count(self, name, value = 1):
+		self.counters[name] = self.counters.get(name, 0) + int(value)
+
+	# Returns the recorded data as a dictionnary that can be pickled and written as JSON
+	def snapshot(self):
+		return {"stages": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in self.stages.items()},
+			"counters": dict(self.counters)}
+
+	# Returns the recorded data as snapshot does and starts again from scratch
+	def takeSnapshot(self):
+		snapshot = self.snapshot()
+		self.stages = {}
+		self.counters = {}
+		return snapshot
+
+	# Adds the data of a snapshot to the profiler
+	def merge(self, snapshot):
+		for name, stage in snapshot["stages"].items():
+			self.record(name, stage["seconds"], stage["calls"])
+		for name, value in snapshot["counters"].items():
+			self.count(name, value)
+
+# Returns a context manager timing the stage name with profiler, doing nothing if profiler is None
+def profiledStage(profiler, name):
+	if profiler is None:
+		return nullcontext()
+	return profiler.stage(name)
+
+# The profiler of the current worker process, set by initWorkerProfiler
+workerProfiler = None
+
+# Initializer of the pool workers creating their profiler if enabled is True
+def initWorkerProfiler(enabled):
+	global workerProfiler
+	workerProfiler = StageProfiler() if enabled else None
+
+# Returns the profiler of the current worker process, None if profiling is disabled
+def currentProfiler():
+	return workerProfiler
+
+# Returns the summary table of the snapshot as a string: one line per stage with its calls, total time, share of
+# the total time of the stages and time per call, then the counters. Nested stages are counted in their parent too
+def profileSummary(snapshot):
+	lines = ["{:<24} {:>12} {:>12} {:>8} {:>14}".format("stage", "calls", "seconds", "share", "per call (ms)")]
+	totalSeconds = sum(stage["seconds"] for stage in snapshot["stages"].values()) or 1
+	for name, stage in sorted(snapshot["stages"].items(), key = lambda item: -item[1]["seconds"]):
+		lines.append("{:<24} {:>12} {:>12.3f} {:>7.1f}% {:>14.4f}".format(name, stage["calls"], stage["seconds"],
+			100 * stage["seconds"] / totalSeconds, 1000 * stage["seconds"] / max(1, stage["calls"])))
+	for name, value in sorted(snapshot["counters"].items()):
+		lines.append("{:<24} {:>12}".format(name, value))
+	return "\n".join(lines)
+
+# Writes the JSON trace of a run to path: the aggregated snapshot, the snapshot and number of work units of every
+# worker (keyed by process ID) and the wall-clock time of the run
+def writeProfileTrace(path, total, workers, wallSeconds):
+	with open(path, "w") as file:
+		json.dump({"wallSeconds": wallSeconds, "total": total, "workers": {str(pid): worker for pid, worker in workers.items()}}, file, indent = 1)
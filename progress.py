@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+
+# Progress of the long runs of the experiments, fed by the results of the work units as the parent receives them.
+# A snapshot gives the throughput, the completed and total units of each level (a number of agents for instance),
+# an estimated time of arrival and, for every worker, its number of units, its utilization (the share of the time
+# it spent computing units) and the time since its last result. Snapshots are printed as one line and written as
+# JSON to a status file every interval seconds by a background thread, so that a stalled pool still gets reported
+
+# Returns a duration in seconds as a readable string such as 2h05m
+def formatDuration(seconds):
+	if seconds is None:
+		return "unknown"
+	seconds = int(seconds)
+	if seconds >= 3600:
+		return "{}h{:02d}m".format(seconds // 3600, (seconds % 3600) // 60)
+	if seconds >= 60:
+		return "{}m{:02d}s".format(seconds // 60, seconds % 60)
+	return "{}s".format(seconds)
+
+class ProgressReporter:
+	# totals maps every level to its number of units to run, statusFile is the path of the JSON status file
+	def __init__(self, totals, statusFile, interval = 30):
+		self.totals = dict(totals)
+		self.completed = {level: 0 for level in self.totals}
+		self.statusFile = statusFile
+		self.interval = interval
+		self.startingTime = time.monotonic()
+		self.profiles = 0
+		self.workers = {}
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = None
+
+	# Starts reporting every interval seconds
+	def start(self):
+		self.thread = threading.Thread(target = self.run, daemon = True)
+		self.thread.start()
+		return self
+
+	# Body of the background thread
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			self.report()
+
+	# Stops the periodic reports and reports a last time
+	def stop(self):
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+		return self.report()
+
+	# Records a completed unit of level, that evaluated numProfiles profiles and that was computed by the worker
+	# described by stats (a dictionnary with its process ID "pid" and the time "seconds" it spent on the unit)
+	def add(self, level, numProfiles, stats):
+		with self.lock:
+			self.completed[level] = self.completed.get(level, 0) + 1
+			self.profiles += numProfiles
+			worker = self.workers.setdefault(stats["pid"], {"units": 0, "busySeconds": 0.0, "lastResult": None})
+			worker["units"] += 1
+			worker["busySeconds"] += stats["seconds"]
+			worker["lastResult"] = time.monotonic()
+
+	# Sets the number of units to run of level to the number of units completed so far, when the run of the level
+	# stops before its planned total
+	def finishLevel(self, level):
+		with self.lock:
+			self.totals[level] = self.completed.get(level, 0)
+
+	# Returns the current state of the run as a dictionnary. The ETA assumes the remaining units go at the average
+	# rate so far. A worker is flagged as stalled when its last result is older than 10 times its average unit
+	def snapshot(self):
+		with self.lock:
+			return self.unlockedSnapshot()
+
+	# Same as snapshot, the lock being already held
+	def unlockedSnapshot(self):
+		now = time.monotonic()
+		elapsed = max(now - self.startingTime, 1e-9)
+		numCompleted = sum(self.completed.values())
+		numTotal = sum(self.totals.values())
+		remaining = max(0, numTotal - numCompleted)
+		workers = {}
+		for pid, worker in self.workers.items():
+			averageUnit = worker["busySeconds"] / worker["units"]
+			sinceLast = now - worker["lastResult"]
+			workers[str(pid)] = {"units": worker["units"], "utilization": min(1.0, worker["busySeconds"] / elapsed),
+				"secondsSinceLastResult": sinceLast, "stalled": remaining > 0 and sinceLast > max(10 * averageUnit, self.interval)}
+		return {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"elapsedSeconds": elapsed,
+			"completedUnits": numCompleted,
+			"totalUnits": numTotal,
+			"profiles": self.profiles,
+			"profilesPerSecond": self.profiles / elapsed,
+			"etaSeconds": remaining * elapsed / numCompleted if numCompleted > 0 else None,
+			"levels": {str(level): {"completed": self.completed.get(level, 0), "total": total} for level, total in self.totals.items()},
+			"workers": workers,
+		}
+
+	# Prints a summary line and writes the snapshot to the status file, through a temporary file so that readers
+	# never see a partial status
+	def report(self):
+		snapshot = self.snapshot()
+		stalled = [pid for pid, worker in snapshot["workers"].items() if worker["stalled"]]
+		print("Progress: {}/{} units ({:.1f}%), {:.1f} profiles/s, ETA {}{}".format(snapshot["completedUnits"], snapshot["totalUnits"],
+			100 * snapshot["completedUnits"] / max(1, snapshot["totalUnits"]), snapshot["profilesPerSecond"], formatDuration(snapshot["etaSeconds"]),
+			", stalled workers: {}".format(", ".join(stalled)) if len(stalled) > 0 else ""))
+		temporaryFile = "{}.{}.tmp".format(self.statusFile, os.getpid())
+		with open(temporaryFile, "w") as file:
+			json.dump(snapshot, file, indent = 1)
+		os.replace(temporaryFile, self.statusFile)
+		return snapshot
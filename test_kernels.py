@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from maj_dynamics import check_kernel_parity
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the Python code in a new interpreter whose MAJ_DYNAMICS_BACKEND is backend and returns its output, the backend
+# being chosen when kernels is imported
+def runWithBackend(backend, code):
+	environment = dict(os.environ, MAJ_DYNAMICS_BACKEND = backend)
+	result = subprocess.run([sys.executable, "-c", code], cwd = REPOSITORY, env = environment, capture_output = True, text = True,
+		check = True)
+	return result.stdout.strip()
+
+# The kernels of the backend of this process agree with the reference implementation
+def test_kernel_parity():
+	assert check_kernel_parity() == 200
+
+# The kernels run as plain Python agree with the reference implementation
+def test_python_kernel_parity():
+	assert runWithBackend("python", "import kernels, maj_dynamics; print(kernels.KERNEL_BACKEND, maj_dynamics.check_kernel_parity())") == "python 200"
+
+# The kernels compiled with numba agree with the reference implementation
+def test_numba_kernel_parity():
+	pytest.importorskip("numba")
+	assert runWithBackend("numba", "import kernels, maj_dynamics; print(kernels.KERNEL_BACKEND, maj_dynamics.check_kernel_parity())") == "numba 200"
+
+# The values of MAJ_DYNAMICS_BACKEND that are not a backend fall back to the python backend
+@pytest.mark.parametrize("backend", ["Python", " python ", "off", "none", ""])
+def test_unknown_backend(backend):
+	assert runWithBackend(backend, "import kernels; print(kernels.KERNEL_BACKEND, kernels.kernels_enabled())") == "python False"